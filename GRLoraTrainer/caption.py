@@ -1,31 +1,270 @@
-import sys
-from pathlib import Path
+import argparse
+import json
+import os
+import queue
 import shutil
-import torch
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
+import caption_cpu
+import caption_onnx
+from caption_cache import CaptionCache, hash_files
+from caption_server import submit_to_server
 
-def caption_images_in_folder(folder_path):
+valid_exts = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+model_names = {
+    "base": "Salesforce/blip-image-captioning-base",
+    "large": "Salesforce/blip-image-captioning-large",
+}
+# Models loaded by this process, so watch mode keeps them warm between passes
+loaded_models = {}
+# Passed to model.generate and recorded in the caption cache key
+generation_settings = {"max_length": 30}
+
+def get_device():
     """
-    For each image in 'folder_path', generate a caption with BLIP,
-    then write it to a .txt file with the same basename.
-    After captioning, move the images and captions to a subfolder with a user-specified prefix.
+    Returns the CUDA device when available, otherwise the CPU.
     """
-    folder = Path(folder_path)
-    if not folder.is_dir():
-        print(f"\n'{folder_path}' is not a valid directory.")
-        return
+    # torch is imported lazily so submitting to a running captioning server stays cheap
+    import torch
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+def load_blip_model(model_name, device):
+    """
+    Loads the BLIP processor and captioning model onto 'device'.
+    """
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+    processor = BlipProcessor.from_pretrained(model_name)
+    model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
+    model.eval()
+    return processor, model
+
+def load_image(img_file, target_size=384):
+    """
+    Opens an image already reduced to roughly 'target_size' on its short side and converts it to RGB,
+    returning None if it cannot be read. Both sides stay at or above 'target_size' so BLIP's own
+    resize never upsamples.
+    """
     try:
-        repeat_number = int(input("Enter the number to prefix the folder name (e.g., 10): "))
-    except ValueError:
-        print("Invalid input. Please enter an integer.")
-        return
+        image = Image.open(str(img_file))
+        # JPEGs decode straight at 1/2, 1/4 or 1/8 scale, skipping most of the work on large photos
+        image.draft("RGB", (target_size, target_size))
+        if image.mode not in ("RGB", "L"):
+            # Palette, alpha, 16-bit and other modes are converted first, resizing does not support them all
+            image = image.convert("RGB")
+        width, height = image.size
+        scale = target_size / min(width, height)
+        if scale < 1:
+            # Shrink before convert so the RGB copy is made from the small image
+            image.thumbnail((max(target_size, round(width * scale)), max(target_size, round(height * scale))),
+                            Image.BICUBIC)
+        return image.convert("RGB")
+    except Exception as e:
+        print(f"Failed to read {img_file.name}: {e}")
+        return None
 
-    # Determine the device early
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+def processor_target_size(processor):
+    """
+    Returns the square input size the processor resizes images to, 384 for BLIP.
+    """
+    size = getattr(getattr(processor, "image_processor", None), "size", None) or {}
+    return min(size.get("height", 384), size.get("width", 384))
 
-    # Prompt user to select a BLIP model
+def prefetch_batches(files, processor, batch_size, decode_workers, prefetch=2, return_tensors="pt", enqueued=None):
+    """
+    Decodes and preprocesses images on background threads so the model never waits on disk.
+    Yields (files, inputs) pairs, one per batch, in the original file order.
+    At most one batch is decoding while 'prefetch' preprocessed batches wait, which bounds memory.
+    If an 'enqueued' dict is given, the time each file is handed to a decode thread is recorded in it.
+    """
+    batch_queue = queue.Queue(maxsize=prefetch)
+    done = object()
+    target_size = processor_target_size(processor)
+    batches = [files[start:start + batch_size] for start in range(0, len(files), batch_size)]
+
+    def producer():
+        try:
+            with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+                def submit(index):
+                    if index >= len(batches):
+                        return []
+                    if enqueued is not None:
+                        enqueued.update((f, time.perf_counter()) for f in batches[index])
+                    return [pool.submit(load_image, f, target_size) for f in batches[index]]
+
+                futures = submit(0)
+                for index, batch_files in enumerate(batches):
+                    images = [future.result() for future in futures]
+                    # Start decoding the next batch while this one is preprocessed and queued
+                    futures = submit(index + 1)
+                    loaded = [(f, image) for f, image in zip(batch_files, images) if image is not None]
+                    if not loaded:
+                        continue
+                    inputs = processor(images=[image for _, image in loaded], return_tensors=return_tensors)
+                    batch_queue.put(([f for f, _ in loaded], inputs))
+            batch_queue.put(done)
+        except Exception as e:
+            batch_queue.put(e)
+
+    thread = threading.Thread(target=producer)
+    thread.daemon = True
+    thread.start()
+
+    while True:
+        item = batch_queue.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def caption_batches(files, processor, model, device, batch_size=8, decode_workers=4, enqueued=None):
+    """
+    Captions 'files' in padded batches and yields (file, caption) pairs in file order.
+    """
+    import torch
+    for batch_files, inputs in prefetch_batches(files, processor, batch_size, decode_workers, enqueued=enqueued):
+        inputs = inputs.to(device)
+        with torch.no_grad():
+            out = model.generate(**inputs, **generation_settings)
+        captions = processor.batch_decode(out, skip_special_tokens=True)
+        for img_file, caption in zip(batch_files, captions):
+            yield img_file, caption.strip()
+
+def generate_captions(files, processor, model, device, batch_size=8, decode_workers=4, log=print):
+    """
+    Captions 'files' in padded batches, writing each caption to a .txt file next to its image.
+    Progress lines go to 'log'. Returns the number of images captioned.
+    """
+    captioned = 0
+    for img_file, caption in caption_batches(files, processor, model, device, batch_size, decode_workers):
+        write_caption(img_file, caption)
+        log(f"Captioned {img_file.name} -> {img_file.with_suffix('.txt').name}: {caption}")
+        captioned += 1
+    return captioned
+
+def write_caption(img_file, caption):
+    """
+    Writes 'caption' to the .txt file next to 'img_file'.
+    """
+    with open(img_file.with_suffix(".txt"), "w", encoding="utf-8") as f:
+        f.write(caption + "\n")
+
+def apply_cached_captions(files, cache):
+    """
+    Writes captions for every file whose content is already in 'cache'.
+    Returns the files that still need captioning and a {file: digest} dict for them.
+    """
+    digests = hash_files(files)
+    cached = cache.get_many(digests.values())
+
+    remaining = []
+    for img_file in files:
+        digest = digests.get(img_file)
+        if digest in cached:
+            write_caption(img_file, cached[digest])
+            print(f"Cached {img_file.name} -> {img_file.with_suffix('.txt').name}: {cached[digest]}")
+        else:
+            remaining.append(img_file)
+
+    print(f"Reused {len(files) - len(remaining)} cached captions, {len(remaining)} images need the model.")
+    return remaining, digests
+
+def store_new_captions(files, digests, cache, since):
+    """
+    Adds the captions written for 'files' since the 'since' timestamp to 'cache'.
+    """
+    new_captions = {}
+    for img_file in files:
+        txt_file = img_file.with_suffix(".txt")
+        if img_file in digests and txt_file.exists() and txt_file.stat().st_mtime >= since:
+            new_captions[digests[img_file]] = txt_file.read_text(encoding="utf-8").strip()
+    cache.put_many(new_captions)
+
+def get_blip_model(model_name, device):
+    """
+    Returns the BLIP processor and model, loading them only the first time they are asked for.
+    """
+    key = (model_name, str(device))
+    if key not in loaded_models:
+        print(f"\nLoading BLIP model ({model_name})...")
+        loaded_models[key] = load_blip_model(model_name, device)
+    return loaded_models[key]
+
+def get_onnx_captioner(model_name):
+    """
+    Returns the ONNX captioner, loading it only the first time it is asked for.
+    """
+    key = (model_name, "onnx")
+    if key not in loaded_models:
+        loaded_models[key] = caption_onnx.load_onnx_captioner(model_name)
+    return loaded_models[key]
+
+def caption_files(pending, model_name, batch_size=8, decode_workers=4, use_cache=True,
+                  cpu_workers=1, quantize=False, compare_sample=0, backend="torch"):
+    """
+    Writes a caption .txt file for every image in 'pending', reusing cached captions,
+    then a running captioning server, then an in-process model. The CPU sharding and INT8
+    options run in-process, the server would ignore them.
+    Returns (captioned, elapsed) for the images that went through a model.
+    """
+    run_start = time.time()
+
+    # The CPU options only apply without CUDA, and then the captions must not come from the server
+    device = get_device() if backend == "torch" and (cpu_workers > 1 or quantize or compare_sample) else None
+    cpu_options = device is not None and device.type == "cpu"
+
+    # Backends that change the numerics get their own cache entries
+    cache_settings = dict(generation_settings)
+    if backend != "torch":
+        cache_settings["backend"] = backend
+    elif quantize and cpu_options:
+        cache_settings["quantize"] = "int8"
+    cache = CaptionCache(model_name, cache_settings) if use_cache else None
+    if pending and cache:
+        pending, digests = apply_cached_captions(pending, cache)
+
+    if pending:
+        # Hand the work to the captioning server if one is running, so the model is already warm
+        use_server = backend == "torch" and not cpu_options
+        result = submit_to_server(pending, model_name, batch_size, decode_workers) if use_server else None
+        if result is None and backend == "onnx":
+            captioner = get_onnx_captioner(model_name)
+            start_time = time.perf_counter()
+            captioned = caption_onnx.generate_captions_onnx(pending, captioner, batch_size, decode_workers)
+            elapsed = time.perf_counter() - start_time
+        elif result is None:
+            device = device or get_device()
+            if device.type == "cpu" and compare_sample:
+                caption_cpu.compare_quantization(pending[:compare_sample], model_name, batch_size, decode_workers)
+
+            if device.type == "cpu" and (cpu_workers > 1 or quantize):
+                # Includes the workers' model load, since it overlaps across processes
+                start_time = time.perf_counter()
+                captioned = caption_cpu.caption_files_cpu(pending, model_name, cpu_workers, quantize, batch_size)
+            else:
+                processor, model = get_blip_model(model_name, device)
+                start_time = time.perf_counter()
+                captioned = generate_captions(pending, processor, model, device, batch_size, decode_workers)
+            elapsed = time.perf_counter() - start_time
+        else:
+            captioned, elapsed = result["captioned"], result["elapsed"]
+    else:
+        captioned, elapsed = 0, 0.0
+
+    if cache:
+        if pending:
+            store_new_captions(pending, digests, cache, run_start)
+        cache.close()
+
+    return captioned, elapsed
+
+def select_model_name():
+    """
+    Prompts the user to pick BLIP Base or Large and returns the model name.
+    """
     print("\nSelect a BLIP model:")
     print("1. BLIP Base (Salesforce/blip-image-captioning-base)")
     print("2. BLIP Large (Salesforce/blip-image-captioning-large)")
@@ -33,54 +272,56 @@ def caption_images_in_folder(folder_path):
     try:
         model_choice = int(input("Enter the number corresponding to your choice: "))
         if model_choice == 1:
-            model_name = "Salesforce/blip-image-captioning-base"
-            processor = BlipProcessor.from_pretrained(model_name)
-            model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
+            return model_names["base"]
         elif model_choice == 2:
-            model_name = "Salesforce/blip-image-captioning-large"
-            processor = BlipProcessor.from_pretrained(model_name)
-            model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
-        else:
-            print("Invalid choice. Defaulting to BLIP Base.")
-            model_name = "Salesforce/blip-image-captioning-base"
-            processor = BlipProcessor.from_pretrained(model_name)
-            model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
+            return model_names["large"]
+        print("Invalid choice. Defaulting to BLIP Base.")
     except ValueError:
         print("Invalid input. Defaulting to BLIP Base.")
-        model_name = "Salesforce/blip-image-captioning-base"
-        processor = BlipProcessor.from_pretrained(model_name)
-        model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
+    return model_names["base"]
 
-    print(f"\nLoading BLIP model ({model_name})...")
+def caption_images_in_folder(folder_path, model_name=None, **options):
+    """
+    For each image in 'folder_path', generate a caption with BLIP,
+    then write it to a .txt file with the same basename.
+    After captioning, move the images and captions to a subfolder with a user-specified prefix.
+    """
+    folder = Path(folder_path)
+    if not folder.is_dir():
+        print(f"\n'{folder_path}' is not a valid directory.")
+        return
 
-    valid_exts = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
-    files = [f for f in folder.iterdir() if f.is_file() and f.suffix.lower() in valid_exts]
+    try:
+        repeat_number = int(input("Enter the number to prefix the folder name (e.g., 10): "))
+    except ValueError:
+        print("Invalid input. Please enter an integer.")
+        return
+
+    # Prompt user to select a BLIP model
+    if model_name is None:
+        model_name = select_model_name()
+
+    files = sorted(f for f in folder.iterdir() if f.is_file() and f.suffix.lower() in valid_exts)
 
     if not files:
         print("\nNo images found to caption.\n")
         return
 
     print(f"\nGenerating captions in: {folder_path}")
+    pending = []
     for img_file in files:
         txt_file = img_file.with_suffix(".txt")
         # Skip if .txt already exists
         if txt_file.exists():
             print(f"Skipping (already captioned): {txt_file.name}")
             continue
+        pending.append(img_file)
 
-        image = Image.open(str(img_file)).convert("RGB")
-        inputs = processor(image, return_tensors="pt").to(device)
-
-        with torch.no_grad():
-            out = model.generate(**inputs, max_length=30)
-        caption = processor.decode(out[0], skip_special_tokens=True)
-
-        with open(txt_file, "w", encoding="utf-8") as f:
-            f.write(caption + "\n")
-
-        print(f"Captioned {img_file.name} -> {txt_file.name}: {caption}")
+    captioned, elapsed = caption_files(pending, model_name, **options)
 
     print("\nCaptioning complete!")
+    if captioned:
+        print(f"Captioned {captioned} images in {elapsed:.1f}s ({captioned / elapsed:.2f} images/sec)")
 
     # Move images and captions to a new subfolder
     new_folder_name = f"{repeat_number}_{folder.name}"
@@ -95,8 +336,131 @@ def caption_images_in_folder(folder_path):
 
     print(f"\nFiles moved to: {new_folder_path}\n")
 
+def load_tree_state(state_path):
+    """
+    Reads the {relative path: [size, mtime_ns]} record of images already processed in a tree.
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_tree_state(state_path, state):
+    """
+    Writes the tree state atomically so an interrupted run never leaves a truncated file.
+    """
+    tmp_path = state_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def scan_tree(root, state, settle_seconds=2.0):
+    """
+    Walks 'root' recursively and returns (changed, current): the images that are new or whose
+    size or mtime differ from 'state', and the up-to-date signature of every settled image.
+    Images modified in the last 'settle_seconds' are left for the next pass, they may still be copying.
+    New images that already have a .txt file are recorded without captioning.
+    """
+    changed = []
+    current = {}
+    now = time.time()
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Skip hidden folders such as the trainer's resized image caches
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() not in valid_exts:
+                continue
+            img_file = Path(dirpath) / name
+            try:
+                stat = img_file.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime < settle_seconds:
+                continue
+
+            key = img_file.relative_to(root).as_posix()
+            signature = [stat.st_size, stat.st_mtime_ns]
+            current[key] = signature
+            previous = state.get(key)
+            if previous == signature:
+                continue
+            if previous is None and img_file.with_suffix(".txt").exists():
+                continue
+            changed.append(img_file)
+    return changed, current
+
+def caption_tree(root_path, model_name, watch_interval=0, **options):
+    """
+    Captions every new or changed image under 'root_path', recursing into subfolders and leaving files in place.
+    Captioned files are remembered in .caption_state.json at the root so each pass only pays for new images.
+    With 'watch_interval', keeps polling the tree every that many seconds until interrupted.
+    """
+    root = Path(root_path)
+    if not root.is_dir():
+        print(f"\n'{root_path}' is not a valid directory.")
+        return
+
+    state_path = root / ".caption_state.json"
+    state = load_tree_state(state_path)
+    print(f"\nCaptioning tree: {root} ({len(state)} images already processed)")
+
+    try:
+        while True:
+            changed, current = scan_tree(root, state)
+            if changed:
+                print(f"\nFound {len(changed)} new or changed images.")
+                captioned, elapsed = caption_files(changed, model_name, **options)
+                if captioned:
+                    print(f"Captioned {captioned} images in {elapsed:.1f}s ({captioned / elapsed:.2f} images/sec)")
+                # Images that got no caption, e.g. ones that failed to decode, stay unrecorded and are retried
+                for img_file in changed:
+                    if not img_file.with_suffix(".txt").exists():
+                        current.pop(img_file.relative_to(root).as_posix(), None)
+            if changed or current.keys() != state.keys():
+                state = current
+                save_tree_state(state_path, state)
+
+            if not watch_interval:
+                break
+            time.sleep(watch_interval)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+    print("\nCaptioning complete!")
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python caption.py <folder_path>")
+    parser = argparse.ArgumentParser(description="Caption a folder of images with BLIP.")
+    parser.add_argument("folder_path", help="Folder containing the images to caption")
+    parser.add_argument("--model", choices=list(model_names), help="BLIP model to use instead of prompting")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Caption new or changed images in the whole tree in place, without prompting or moving files")
+    parser.add_argument("--watch", type=float, default=0, metavar="SECONDS",
+                        help="With --recursive, keep polling the tree for new images every SECONDS")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per generate call (default: 8)")
+    parser.add_argument("--decode-workers", type=int, default=4, help="Threads decoding images ahead of the model (default: 4)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the shared caption cache")
+    parser.add_argument("--cpu-workers", type=int, default=1,
+                        help="Without CUDA, shard images across this many captioning processes (default: 1)")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Without CUDA, apply dynamic INT8 quantization to the BLIP text decoder")
+    parser.add_argument("--compare-quantization", type=int, default=0, metavar="N",
+                        help="Without CUDA, caption N images with fp32 and INT8 and report the quality delta first")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch",
+                        help="Inference backend, onnx runs exported graphs on onnxruntime's CPU provider (default: torch)")
+    args = parser.parse_args()
+
+    options = {
+        "batch_size": max(1, args.batch_size),
+        "decode_workers": max(1, args.decode_workers),
+        "use_cache": not args.no_cache,
+        "cpu_workers": max(1, args.cpu_workers),
+        "quantize": args.quantize,
+        "compare_sample": max(0, args.compare_quantization),
+        "backend": args.backend,
+    }
+    model_name = model_names[args.model] if args.model else None
+    if args.recursive or args.watch:
+        caption_tree(args.folder_path, model_name or model_names["base"], watch_interval=args.watch, **options)
     else:
-        caption_images_in_folder(sys.argv[1])
+        caption_images_in_folder(args.folder_path, model_name, **options)
@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image, ImageDraw
+
+def make_synthetic_images(output_dir, count=64, size=(3000, 2000), seed=1234):
+    """
+    Writes 'count' reproducible JPEGs of random shapes to 'output_dir' and returns their paths.
+    The default size is in the range of camera photos, so decoding cost is realistic.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(count):
+        image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(20):
+            x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+            x1, y1 = x0 + rng.randrange(50, size[0] // 2), y0 + rng.randrange(50, size[1] // 2)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            if rng.random() < 0.5:
+                draw.ellipse((x0, y0, x1, y1), fill=color)
+            else:
+                draw.rectangle((x0, y0, x1, y1), fill=color)
+        path = output_dir / f"synthetic_{index:04d}.jpg"
+        image.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of 'values', e.g. fraction=0.95 for p95.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, min(len(ordered), math.ceil(fraction * len(ordered))))
+    return ordered[rank - 1]
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process in MB, or None if it cannot be read.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+def run_config(config, image_paths):
+    """
+    Runs one benchmark configuration in the current process and returns its measurements.
+    Times caption.py's own pipeline for the configured backend, so decoding and preprocessing are included.
+    Each image's latency runs from being handed to a decode thread to its caption coming out.
+    Meant to be called in a fresh process so model load time and peak memory are not shared between runs.
+    """
+    import torch
+    import caption
+    import caption_cpu
+    import caption_onnx
+
+    device = torch.device(config["device"])
+    model_name = caption.model_names[config["model"]]
+    files = [Path(p) for p in image_paths]
+
+    start_time = time.perf_counter()
+    if config["backend"] == "onnx":
+        captioner = caption_onnx.load_onnx_captioner(model_name)
+
+        def batches(batch_files, decode_workers, enqueued=None):
+            return caption_onnx.caption_batches_onnx(batch_files, captioner, config["batch_size"], decode_workers, enqueued)
+    else:
+        processor, model = caption.load_blip_model(model_name, device)
+        if config["backend"] == "int8":
+            caption_cpu.quantize_text_decoder(model)
+
+        def batches(batch_files, decode_workers, enqueued=None):
+            return caption.caption_batches(batch_files, processor, model, device, config["batch_size"], decode_workers, enqueued)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    load_time = time.perf_counter() - start_time
+
+    # One warm-up batch so one-off kernel selection and allocation do not land in the latencies
+    list(batches(files[:config["batch_size"]], 1))
+
+    enqueued = {}
+    latencies = []
+    start_time = time.perf_counter()
+    for img_file, _ in batches(files, config["decode_workers"], enqueued):
+        latencies.append(time.perf_counter() - enqueued[img_file])
+    total_time = time.perf_counter() - start_time
+
+    result = dict(config)
+    result.update({
+        "images": len(latencies),
+        "images_per_sec": len(latencies) / total_time if total_time else None,
+        "p50_latency_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_latency_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "model_load_s": load_time,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    if device.type == "cuda":
+        result["peak_cuda_mb"] = torch.cuda.max_memory_allocated(device) / (1024 * 1024)
+    return result
+
+def run_benchmark(image_paths, models, devices, batch_sizes, decode_workers, backends=("torch",)):
+    """
+    Runs every combination of the swept settings, each in its own process, and returns the results.
+    The INT8 and ONNX backends only run on the CPU, so they are not combined with other devices.
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for model, backend, device, batch_size, workers in itertools.product(models, backends, devices, batch_sizes, decode_workers):
+        if backend != "torch" and device != "cpu":
+            continue
+        config = {"model": model, "backend": backend, "device": device, "batch_size": batch_size, "decode_workers": workers}
+        print(f"Benchmarking {config}...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                result = pool.submit(run_config, config, [str(p) for p in image_paths]).result()
+            except Exception as e:
+                result = dict(config, error=str(e))
+        results.append(result)
+    return results
+
+def available_devices():
+    """
+    Returns the devices worth benchmarking on this machine.
+    """
+    import torch
+    return ["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark caption.py throughput, latency and memory.")
+    parser.add_argument("--images", help="Folder of images to use instead of the synthetic set")
+    parser.add_argument("--count", type=int, default=64, help="Number of synthetic images (default: 64)")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for the synthetic images (default: 1234)")
+    parser.add_argument("--models", nargs="+", default=["base"], choices=["base", "large"])
+    parser.add_argument("--backends", nargs="+", default=["torch"], choices=["torch", "int8", "onnx"],
+                        help="Inference backends to sweep, int8 and onnx run on the CPU only (default: torch)")
+    parser.add_argument("--devices", nargs="+", help="Devices to sweep (default: cpu, plus cuda when available)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--decode-workers", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.images:
+            import caption
+            image_paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in caption.valid_exts)
+        else:
+            print(f"Generating {args.count} synthetic images...", file=sys.stderr)
+            image_paths = make_synthetic_images(tmp_dir, args.count, seed=args.seed)
+
+        results = run_benchmark(image_paths, args.models, args.devices or available_devices(),
+                                args.batch_sizes, args.decode_workers, args.backends)
+
+    report = json.dumps({"images": len(image_paths), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        print(f"Benchmark report written to: {args.output}", file=sys.stderr)
+    else:
+        print(report)
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from file_utils import hash_file
+
+# Captions are shared by every dataset folder, so the cache lives outside of them
+default_cache_path = Path.home() / ".grloratrainer" / "caption_cache.db"
+
+def hash_files(files, workers=8):
+    """
+    Hashes 'files' on a thread pool and returns a {file: digest} dict.
+    Files that cannot be read are left out.
+    """
+    def safe_hash(file_path):
+        try:
+            return hash_file(file_path)
+        except OSError as e:
+            print(f"Failed to hash {Path(file_path).name}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = list(pool.map(safe_hash, files))
+    return {f: d for f, d in zip(files, digests) if d is not None}
+
+class CaptionCache:
+    """
+    Persistent SQLite store of captions keyed by image content hash, model name and generation settings,
+    so renamed, re-exported or moved copies of an image are never captioned twice.
+    """
+    def __init__(self, model_name, settings, db_path=default_cache_path):
+        self.model_name = model_name
+        self.settings = json.dumps(settings, sort_keys=True)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions ("
+            "image_hash TEXT NOT NULL, model_name TEXT NOT NULL, settings TEXT NOT NULL, "
+            "caption TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (image_hash, model_name, settings))"
+        )
+        self.conn.commit()
+
+    def get_many(self, digests):
+        """
+        Returns a {digest: caption} dict for every digest already in the cache.
+        """
+        found = {}
+        digests = list(set(digests))
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT image_hash, caption FROM captions WHERE model_name = ? AND settings = ? "
+                f"AND image_hash IN ({placeholders})",
+                [self.model_name, self.settings, *chunk],
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, captions):
+        """
+        Stores a {digest: caption} dict, replacing any existing entries.
+        """
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO captions (image_hash, model_name, settings, caption, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(digest, self.model_name, self.settings, caption, now) for digest, caption in captions.items()],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
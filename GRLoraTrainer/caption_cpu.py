@@ -0,0 +1,106 @@
+import copy
+import difflib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+def quantize_text_decoder(model):
+    """
+    Applies dynamic INT8 quantization to the Linear layers of BLIP's text decoder.
+    The vision encoder stays in fp32, it runs once per image while the decoder runs once per token.
+    """
+    import torch
+    model.text_decoder = torch.quantization.quantize_dynamic(
+        model.text_decoder, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return model
+
+def caption_shard(file_paths, model_name, quantize, threads, batch_size):
+    """
+    Worker process entry point: loads BLIP on the CPU and captions one shard of images.
+    Returns a list of (path, caption) pairs.
+    """
+    import torch
+    # Imported here because caption.py imports this module
+    import caption
+
+    # Each worker gets its own slice of the cores instead of every process fighting over all of them
+    torch.set_num_threads(threads)
+    device = torch.device("cpu")
+    processor, model = caption.load_blip_model(model_name, device)
+    if quantize:
+        quantize_text_decoder(model)
+
+    files = [Path(p) for p in file_paths]
+    return [(str(f), text) for f, text in caption.caption_batches(files, processor, model, device, batch_size, 1)]
+
+def caption_files_cpu(files, model_name, workers, quantize, batch_size):
+    """
+    Captions 'files' across 'workers' CPU processes and writes the .txt files in the original file order,
+    so the output does not depend on which shard finishes first. Returns the number of images captioned.
+    """
+    import caption
+
+    workers = max(1, min(workers, len(files)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"\nCaptioning on CPU with {workers} processes x {threads} threads"
+          f"{' (INT8 text decoder)' if quantize else ''}, loading {model_name} in each...")
+
+    # Interleave the files so every shard gets a similar mix of image sizes
+    shards = [[str(f) for f in files[i::workers]] for i in range(workers)]
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(caption_shard, shard, model_name, quantize, threads, batch_size) for shard in shards]
+        for future in futures:
+            results.update(future.result())
+
+    captioned = 0
+    for img_file in files:
+        text = results.get(str(img_file))
+        if text is None:
+            continue
+        caption.write_caption(img_file, text)
+        print(f"Captioned {img_file.name} -> {img_file.with_suffix('.txt').name}: {text}")
+        captioned += 1
+    return captioned
+
+def compare_quantization(files, model_name, batch_size, decode_workers):
+    """
+    Captions 'files' with the fp32 model and with an INT8 text decoder and prints
+    the speedup and how closely the captions agree, so speed can be weighed against fidelity.
+    """
+    import torch
+    import caption
+
+    if not files:
+        return
+
+    print(f"\nComparing fp32 and INT8 captions on {len(files)} images...")
+    device = torch.device("cpu")
+    processor, model = caption.load_blip_model(model_name, device)
+    quantized = quantize_text_decoder(copy.deepcopy(model))
+
+    def run(m):
+        start_time = time.perf_counter()
+        captions = dict(caption.caption_batches(files, processor, m, device, batch_size, decode_workers))
+        return captions, time.perf_counter() - start_time
+
+    fp32_captions, fp32_time = run(model)
+    int8_captions, int8_time = run(quantized)
+
+    similarities = []
+    exact = 0
+    for img_file, reference in fp32_captions.items():
+        candidate = int8_captions.get(img_file, "")
+        exact += candidate == reference
+        similarities.append(difflib.SequenceMatcher(None, reference.split(), candidate.split()).ratio())
+        if candidate != reference:
+            print(f"  {img_file.name}:\n    fp32: {reference}\n    int8: {candidate}")
+
+    count = len(similarities)
+    if not count:
+        return
+    print(f"fp32: {fp32_time:.1f}s, INT8: {int8_time:.1f}s ({fp32_time / max(int8_time, 1e-9):.2f}x speedup)")
+    print(f"Identical captions: {exact}/{count} ({100 * exact / count:.0f}%), "
+          f"mean word similarity: {sum(similarities) / count:.3f}\n")
@@ -0,0 +1,210 @@
+import argparse
+from pathlib import Path
+import numpy as np
+
+# Exported graphs are kept per model, next to the caption cache
+default_onnx_root = Path.home() / ".grloratrainer" / "onnx"
+
+vision_file = "vision_encoder.onnx"
+decoder_init_file = "text_decoder_init.onnx"
+decoder_past_file = "text_decoder_with_past.onnx"
+
+def onnx_dir_for(model_name, onnx_root=default_onnx_root):
+    """
+    Returns the folder holding the exported graphs for 'model_name'.
+    """
+    return Path(onnx_root) / model_name.replace("/", "--")
+
+def export_blip_onnx(model_name, output_dir, opset=17):
+    """
+    Exports a BLIP captioning checkpoint as three ONNX graphs: the vision encoder,
+    the text decoder's first step, and the text decoder step that reuses the self-attention KV cache.
+    """
+    import torch
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"Loading {model_name} for export...")
+    processor = BlipProcessor.from_pretrained(model_name)
+    model = BlipForConditionalGeneration.from_pretrained(model_name).eval()
+    text_config = model.config.text_config
+    num_layers = text_config.num_hidden_layers
+    num_heads = text_config.num_attention_heads
+    head_dim = text_config.hidden_size // num_heads
+
+    class VisionEncoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.vision_model = model.vision_model
+
+        def forward(self, pixel_values):
+            return self.vision_model(pixel_values=pixel_values)[0]
+
+    class TextDecoderStep(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.text_decoder = model.text_decoder
+
+        def forward(self, input_ids, encoder_hidden_states, *past):
+            past_key_values = tuple(zip(past[0::2], past[1::2])) if past else None
+            out = self.text_decoder(
+                input_ids=input_ids,
+                encoder_hidden_states=encoder_hidden_states,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True,
+            )
+            present = out.past_key_values
+            if hasattr(present, "to_legacy_cache"):
+                present = present.to_legacy_cache()
+            # Only the self-attention key/value pairs are cached, cross-attention is recomputed from the image
+            flat = [tensor for layer in present for tensor in layer[:2]]
+            return (out.logits[:, -1, :], *flat)
+
+    pixel_values = processor(images=[np.zeros((384, 384, 3), dtype=np.uint8)], return_tensors="pt")["pixel_values"]
+    with torch.no_grad():
+        image_embeds = model.vision_model(pixel_values=pixel_values)[0]
+    input_ids = torch.full((1, 1), text_config.bos_token_id, dtype=torch.long)
+
+    past_names = [f"past_{i}_{kind}" for i in range(num_layers) for kind in ("key", "value")]
+    present_names = [f"present_{i}_{kind}" for i in range(num_layers) for kind in ("key", "value")]
+    dummy_past = [torch.zeros(1, num_heads, 1, head_dim) for _ in past_names]
+
+    print("Exporting vision encoder...")
+    torch.onnx.export(
+        VisionEncoder(), (pixel_values,), str(output_dir / vision_file),
+        input_names=["pixel_values"], output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=opset,
+    )
+
+    step_axes = {
+        "input_ids": {0: "batch"},
+        "encoder_hidden_states": {0: "batch"},
+        "logits": {0: "batch"},
+        **{name: {0: "batch", 2: "past_length"} for name in past_names},
+        **{name: {0: "batch", 2: "total_length"} for name in present_names},
+    }
+
+    print("Exporting text decoder (first step)...")
+    torch.onnx.export(
+        TextDecoderStep(), (input_ids, image_embeds), str(output_dir / decoder_init_file),
+        input_names=["input_ids", "encoder_hidden_states"], output_names=["logits", *present_names],
+        dynamic_axes={k: v for k, v in step_axes.items() if k not in past_names},
+        opset_version=opset,
+    )
+
+    print("Exporting text decoder (with KV cache)...")
+    torch.onnx.export(
+        TextDecoderStep(), (input_ids, image_embeds, *dummy_past), str(output_dir / decoder_past_file),
+        input_names=["input_ids", "encoder_hidden_states", *past_names], output_names=["logits", *present_names],
+        dynamic_axes=step_axes,
+        opset_version=opset,
+    )
+
+    print(f"ONNX graphs written to: {output_dir}")
+
+class OnnxBlipCaptioner:
+    """
+    Greedy BLIP captioning on onnxruntime's CPU execution provider, feeding each step's
+    self-attention cache back into the next step instead of re-running the whole prefix.
+    """
+    def __init__(self, model_name, onnx_dir, threads=0):
+        import onnxruntime as ort
+        from transformers import BlipConfig, BlipProcessor
+
+        self.processor = BlipProcessor.from_pretrained(model_name)
+        text_config = BlipConfig.from_pretrained(model_name).text_config
+        self.bos_token_id = text_config.bos_token_id
+        self.eos_token_id = text_config.sep_token_id
+        self.pad_token_id = text_config.pad_token_id
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = ["CPUExecutionProvider"]
+        onnx_dir = Path(onnx_dir)
+        self.vision = ort.InferenceSession(str(onnx_dir / vision_file), options, providers=providers)
+        self.decoder_init = ort.InferenceSession(str(onnx_dir / decoder_init_file), options, providers=providers)
+        self.decoder_past = ort.InferenceSession(str(onnx_dir / decoder_past_file), options, providers=providers)
+        self.past_names = [i.name for i in self.decoder_past.get_inputs() if i.name.startswith("past_")]
+
+    def caption(self, pixel_values, max_length=30):
+        """
+        Returns one caption per image in the 'pixel_values' batch.
+        """
+        image_embeds = self.vision.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0]
+        batch = image_embeds.shape[0]
+
+        next_ids = np.full((batch, 1), self.bos_token_id, dtype=np.int64)
+        outputs = self.decoder_init.run(None, {"input_ids": next_ids, "encoder_hidden_states": image_embeds})
+
+        tokens = [next_ids[:, 0]]
+        finished = np.zeros(batch, dtype=bool)
+        # max_length counts the start token, the same way transformers' generate does
+        for step in range(1, max_length):
+            logits, present = outputs[0], outputs[1:]
+            next_tokens = np.where(finished, self.pad_token_id, logits.argmax(axis=-1))
+            tokens.append(next_tokens)
+            finished |= next_tokens == self.eos_token_id
+            if finished.all() or step == max_length - 1:
+                break
+
+            feed = {"input_ids": next_tokens[:, None].astype(np.int64), "encoder_hidden_states": image_embeds}
+            feed.update(zip(self.past_names, present))
+            outputs = self.decoder_past.run(None, feed)
+
+        return [text.strip() for text in self.processor.batch_decode(np.stack(tokens, axis=1), skip_special_tokens=True)]
+
+def load_onnx_captioner(model_name, onnx_root=default_onnx_root):
+    """
+    Loads the ONNX captioner for 'model_name', exporting the graphs first if they do not exist yet.
+    """
+    onnx_dir = onnx_dir_for(model_name, onnx_root)
+    if not all((onnx_dir / name).exists() for name in (vision_file, decoder_init_file, decoder_past_file)):
+        print(f"No ONNX export found for {model_name}, exporting to {onnx_dir}...")
+        export_blip_onnx(model_name, onnx_dir)
+    print(f"\nLoading ONNX BLIP model ({model_name})...")
+    return OnnxBlipCaptioner(model_name, onnx_dir)
+
+def caption_batches_onnx(files, captioner, batch_size=8, decode_workers=4, enqueued=None):
+    """
+    Captions 'files' with an OnnxBlipCaptioner and yields (file, caption) pairs in file order.
+    """
+    # Imported here because caption.py imports this module
+    import caption
+
+    max_length = caption.generation_settings["max_length"]
+    batches = caption.prefetch_batches(files, captioner.processor, batch_size, decode_workers, return_tensors="np",
+                                     enqueued=enqueued)
+    for batch_files, inputs in batches:
+        for img_file, text in zip(batch_files, captioner.caption(inputs["pixel_values"], max_length)):
+            yield img_file, text
+
+def generate_captions_onnx(files, captioner, batch_size=8, decode_workers=4, log=print):
+    """
+    ONNX counterpart of caption.generate_captions, writing the same .txt layout.
+    Returns the number of images captioned.
+    """
+    import caption
+
+    captioned = 0
+    for img_file, text in caption_batches_onnx(files, captioner, batch_size, decode_workers):
+        caption.write_caption(img_file, text)
+        log(f"Captioned {img_file.name} -> {img_file.with_suffix('.txt').name}: {text}")
+        captioned += 1
+    return captioned
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export BLIP captioning models to ONNX for caption.py --backend onnx.")
+    parser.add_argument("models", nargs="*", default=["base"], help="base, large or a model name (default: base)")
+    parser.add_argument("--onnx-root", default=str(default_onnx_root), help="Folder the exported graphs are written under")
+    args = parser.parse_args()
+
+    import caption
+    for name in args.models:
+        model_name = caption.model_names.get(name, name)
+        export_blip_onnx(model_name, onnx_dir_for(model_name, args.onnx_root))
@@ -0,0 +1,174 @@
+import argparse
+import os
+import secrets
+import time
+from pathlib import Path
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+# Local address the captioning server listens on; caption.py falls back to in-process mode when nothing answers here
+server_address = ("127.0.0.1", 6150)
+# Random key shared by the server and its clients, readable only by the user. Connections are
+# pickled, so only processes that can read this file may talk to the server.
+authkey_path = Path.home() / ".grloratrainer" / "caption_server.key"
+
+def load_authkey(create=False):
+    """
+    Returns the server's authentication key, generating it on first use when 'create' is set.
+    Returns None if there is no key yet.
+    """
+    try:
+        return authkey_path.read_bytes()
+    except FileNotFoundError:
+        if not create:
+            return None
+    authkey_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(authkey_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return authkey_path.read_bytes()
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_bytes(32))
+    return authkey_path.read_bytes()
+
+def connect_to_server():
+    """
+    Opens a connection to a running captioning server, or returns None if none is listening.
+    """
+    authkey = load_authkey()
+    if authkey is None:
+        return None
+    try:
+        return Client(server_address, authkey=authkey)
+    except (OSError, AuthenticationError):
+        return None
+
+def submit_to_server(files, model_name, batch_size, decode_workers):
+    """
+    Sends a list of images to the captioning server and relays its progress output.
+    Returns a dict with 'captioned' and 'elapsed', or None if no server is running.
+    """
+    conn = connect_to_server()
+    if conn is None:
+        return None
+
+    print(f"\nSubmitting {len(files)} images to the captioning server ({model_name})...")
+    with conn:
+        conn.send({
+            "command": "caption",
+            "files": [str(f) for f in files],
+            "model_name": model_name,
+            "batch_size": batch_size,
+            "decode_workers": decode_workers,
+        })
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                print("Captioning server closed the connection.")
+                return None
+            if "log" in message:
+                print(message["log"])
+            elif "error" in message:
+                print(f"Captioning server error: {message['error']}")
+                return None
+            else:
+                return message
+
+def is_server_running():
+    """
+    Returns True if a captioning server answers a ping.
+    """
+    conn = connect_to_server()
+    if conn is None:
+        return False
+    with conn:
+        conn.send({"command": "ping"})
+        return conn.recv().get("status") == "ok"
+
+def stop_server():
+    """
+    Asks a running captioning server to shut down. Returns False if none was running.
+    """
+    conn = connect_to_server()
+    if conn is None:
+        return False
+    with conn:
+        conn.send({"command": "shutdown"})
+        conn.recv()
+    return True
+
+def serve(preload):
+    """
+    Keeps BLIP models loaded and captions folders submitted by caption.py, one request at a time.
+    """
+    # Imported here because caption.py imports this module for submit_to_server
+    import caption
+
+    device = caption.get_device()
+    models = {}
+
+    def get_model(model_name):
+        if model_name not in models:
+            print(f"Loading BLIP model ({model_name}) on {device}...")
+            models[model_name] = caption.load_blip_model(model_name, device)
+        return models[model_name]
+
+    for name in preload:
+        get_model(caption.model_names.get(name, name))
+
+    with Listener(server_address, authkey=load_authkey(create=True)) as listener:
+        print(f"Captioning server listening on {server_address[0]}:{server_address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, AuthenticationError) as e:
+                print(f"Rejected connection: {e}")
+                continue
+
+            with conn:
+                try:
+                    request = conn.recv()
+                    command = request.get("command")
+                    if command == "ping":
+                        conn.send({"status": "ok", "models": list(models)})
+                    elif command == "shutdown":
+                        conn.send({"status": "ok"})
+                        print("Captioning server shutting down.")
+                        return
+                    elif command == "caption":
+                        processor, model = get_model(request["model_name"])
+                        files = [Path(f) for f in request["files"]]
+                        print(f"Captioning {len(files)} images with {request['model_name']}...")
+                        start_time = time.perf_counter()
+                        captioned = caption.generate_captions(
+                            files, processor, model, device,
+                            request["batch_size"], request["decode_workers"],
+                            log=lambda line: conn.send({"log": line}),
+                        )
+                        elapsed = time.perf_counter() - start_time
+                        print(f"Captioned {captioned} images in {elapsed:.1f}s")
+                        conn.send({"captioned": captioned, "elapsed": elapsed})
+                    else:
+                        conn.send({"error": f"Unknown command: {command}"})
+                except (EOFError, OSError):
+                    print("Client disconnected.")
+                except Exception as e:
+                    print(f"Request failed: {e}")
+                    try:
+                        conn.send({"error": str(e)})
+                    except OSError:
+                        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived BLIP captioning server for caption.py.")
+    parser.add_argument("--preload", nargs="*", default=["base"],
+                        help="Models to load at startup: base, large or a model name (default: base)")
+    parser.add_argument("--stop", action="store_true", help="Stop a running captioning server and exit")
+    args = parser.parse_args()
+
+    if args.stop:
+        print("Captioning server stopped." if stop_server() else "No captioning server is running.")
+    elif is_server_running():
+        print("A captioning server is already running.")
+    else:
+        serve(args.preload)
@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+
+valid_exts = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+manifest_name = ".preflight_manifest.json"
+
+def make_bucket_resolutions(resolution, min_size=256, max_size=1024, divisible=64):
+    """
+    Returns the aspect-ratio buckets kohya's sd-scripts builds for a square training resolution,
+    using its default bucket limits.
+    """
+    max_area = resolution * resolution
+    buckets = set()
+    width = int(math.sqrt(max_area) // divisible) * divisible
+    buckets.add((width, width))
+
+    width = min_size
+    while width <= max_size:
+        height = min(max_size, int((max_area // width) // divisible) * divisible)
+        if height >= min_size:
+            buckets.add((width, height))
+            buckets.add((height, width))
+        width += divisible
+    return sorted(buckets)
+
+def assign_bucket(width, height, buckets):
+    """
+    Picks the bucket with the closest aspect ratio, the way kohya does, and returns it
+    with the fraction of the image lost to cropping once it is scaled to cover the bucket.
+    """
+    aspect = width / height
+    bucket = min(buckets, key=lambda b: abs(b[0] / b[1] - aspect))
+    scale = max(bucket[0] / width, bucket[1] / height)
+    crop_loss = 1 - (bucket[0] * bucket[1]) / (width * height * scale * scale)
+    return bucket, crop_loss
+
+def inspect_image(path):
+    """
+    Reads an image's header for its dimensions, then decodes it to prove the file is intact.
+    JPEGs are decoded at reduced scale, which still walks the whole compressed stream.
+    """
+    entry = {"width": None, "height": None, "ok": False, "error": None}
+    try:
+        with Image.open(path) as image:
+            entry["width"], entry["height"] = image.size
+            image.draft("RGB", (max(1, image.size[0] // 8), max(1, image.size[1] // 8)))
+            image.load()
+        entry["ok"] = True
+    except Exception as e:
+        entry["error"] = str(e) or type(e).__name__
+    return entry
+
+def load_manifest(manifest_path):
+    """
+    Reads a preflight manifest, returning an empty one if it is missing or unreadable.
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"images": {}}
+
+def save_manifest(manifest_path, manifest):
+    """
+    Writes the manifest atomically.
+    """
+    tmp_path = Path(str(manifest_path) + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def build_manifest(dataset_path, resolution, workers=None):
+    """
+    Indexes every image in 'dataset_path': dimensions, decodability, caption pairing and aspect bucket.
+    Images whose size and mtime match the cached manifest are not re-read, so a resume
+    on an unchanged dataset only costs a directory listing.
+    Returns the manifest dict.
+    """
+    dataset = Path(dataset_path)
+    manifest_path = dataset / manifest_name
+    cached = load_manifest(manifest_path).get("images", {})
+    buckets = make_bucket_resolutions(int(resolution))
+
+    images = {}
+    to_inspect = []
+    for entry in sorted(os.scandir(dataset), key=lambda e: e.name):
+        if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in valid_exts:
+            continue
+        stat = entry.stat()
+        previous = cached.get(entry.name)
+        if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+            images[entry.name] = previous
+        else:
+            images[entry.name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            to_inspect.append(entry.name)
+
+    if to_inspect:
+        print(f"Preflight: inspecting {len(to_inspect)} new or changed images "
+              f"({len(images) - len(to_inspect)} unchanged from the manifest)...")
+        paths = [str(dataset / name) for name in to_inspect]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name, result in zip(to_inspect, pool.map(inspect_image, paths, chunksize=16)):
+                images[name].update(result)
+    else:
+        print(f"Preflight: all {len(images)} images unchanged from the manifest.")
+
+    # Caption pairing and buckets are cheap, so they are refreshed on every run
+    for name, entry in images.items():
+        txt_file = dataset / (os.path.splitext(name)[0] + ".txt")
+        entry["caption"] = txt_file.exists() and txt_file.stat().st_size > 0
+        if entry.get("ok"):
+            bucket, crop_loss = assign_bucket(entry["width"], entry["height"], buckets)
+            entry["bucket"] = list(bucket)
+            entry["crop_loss"] = round(crop_loss, 4)
+
+    manifest = {"resolution": int(resolution), "images": images}
+    save_manifest(manifest_path, manifest)
+    return manifest
+
+def summarize_manifest(manifest, crop_warning=0.2):
+    """
+    Prints the preflight report and returns the number of problems found
+    (unreadable images and images without a caption).
+    """
+    images = manifest["images"]
+    failed = {name: e for name, e in images.items() if not e.get("ok")}
+    uncaptioned = [name for name, e in images.items() if e.get("ok") and not e.get("caption")]
+
+    bucket_counts = defaultdict(list)
+    for entry in images.values():
+        if entry.get("ok"):
+            bucket_counts[tuple(entry["bucket"])].append(entry["crop_loss"])
+
+    print(f"\nPreflight at resolution {manifest['resolution']}: {len(images) - len(failed)} of {len(images)} images readable.")
+    for name, entry in failed.items():
+        print(f"  Unreadable: {name} ({entry.get('error')})")
+    for name in uncaptioned:
+        print(f"  Missing or empty caption: {name}")
+
+    print("Aspect buckets:")
+    for bucket, losses in sorted(bucket_counts.items(), key=lambda item: -len(item[1])):
+        mean_loss = sum(losses) / len(losses)
+        warning = "  <- heavy cropping" if mean_loss > crop_warning else ""
+        print(f"  {bucket[0]}x{bucket[1]}: {len(losses)} images, mean crop loss {mean_loss:.0%}{warning}")
+
+    return len(failed) + len(uncaptioned)
+
+def run_preflight(dataset_path, resolution):
+    """
+    Builds the manifest and prints the report. Returns True if training should go ahead,
+    asking the user when problems were found.
+    """
+    manifest = build_manifest(dataset_path, resolution)
+    problems = summarize_manifest(manifest)
+    if not problems:
+        return True
+    confirm = input(f"\nPreflight found {problems} problems. Continue anyway? (yes/no): ").strip().lower()
+    return confirm in ["yes", "y"]
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python dataset_preflight.py <dataset_path> [resolution]")
+    else:
+        summarize_manifest(build_manifest(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 1024))
@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+from dataset_preflight import build_manifest, save_manifest
+
+index_name = ".resize_index.json"
+save_options = {
+    ".jpg": {"quality": 95, "subsampling": 0},
+    ".jpeg": {"quality": 95, "subsampling": 0},
+    ".webp": {"quality": 95},
+}
+
+def resized_cache_dir(dataset_path, resolution):
+    """
+    Returns the folder holding the resized copy of 'dataset_path' at 'resolution'.
+    It sits inside the dataset so resume.py's state folder list is not cluttered.
+    """
+    return Path(dataset_path) / f".resized_{resolution}"
+
+def resize_to_bucket(source, destination, bucket):
+    """
+    Scales an image to cover its bucket and center-crops it to exactly the bucket size,
+    so the trainer's data loader has nothing left to resize.
+    """
+    width, height = bucket
+    with Image.open(source) as image:
+        image.draft("RGB", (width, height))
+        image = image.convert("RGB")
+        scale = max(width / image.width, height / image.height)
+        resized_size = (max(width, round(image.width * scale)), max(height, round(image.height * scale)))
+        image = image.resize(resized_size, Image.LANCZOS, reducing_gap=3.0)
+        left = (image.width - width) // 2
+        top = (image.height - height) // 2
+        image = image.crop((left, top, left + width, top + height))
+        tmp_path = destination.with_name(destination.stem + ".tmp" + destination.suffix)
+        image.save(tmp_path, **save_options.get(destination.suffix.lower(), {}))
+    os.replace(tmp_path, destination)
+    return str(destination)
+
+def resize_job(job):
+    """
+    Process pool entry point, returns (name, error or None).
+    """
+    name, source, destination, bucket = job
+    try:
+        resize_to_bucket(Path(source), Path(destination), bucket)
+        return name, None
+    except Exception as e:
+        return name, str(e) or type(e).__name__
+
+def build_resized_cache(dataset_path, resolution, manifest=None, workers=None):
+    """
+    Produces a bucket-aligned copy of the dataset at 'resolution' with matching captions.
+    Only images whose source size, mtime or bucket changed are resized again, and copies of
+    removed images are deleted. Returns the cache folder.
+    """
+    dataset = Path(dataset_path)
+    if manifest is None or manifest.get("resolution") != int(resolution):
+        manifest = build_manifest(dataset, resolution)
+    cache_dir = resized_cache_dir(dataset, resolution)
+    cache_dir.mkdir(exist_ok=True)
+
+    index_path = cache_dir / index_name
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    jobs = []
+    current = {}
+    for name, entry in manifest["images"].items():
+        if not entry.get("ok"):
+            continue
+        signature = {"size": entry["size"], "mtime_ns": entry["mtime_ns"], "bucket": entry["bucket"]}
+        current[name] = signature
+        if index.get(name) != signature or not (cache_dir / name).exists():
+            jobs.append((name, str(dataset / name), str(cache_dir / name), entry["bucket"]))
+
+    # Drop copies whose source is gone or no longer readable
+    for name in set(index) - set(current):
+        for stale in (cache_dir / name, cache_dir / (os.path.splitext(name)[0] + ".txt")):
+            if stale.exists():
+                stale.unlink()
+
+    if jobs:
+        print(f"Resizing {len(jobs)} images to their {resolution} buckets "
+              f"({len(current) - len(jobs)} already cached)...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for name, error in pool.map(resize_job, jobs, chunksize=4):
+                if error:
+                    print(f"  Failed to resize {name}: {error}")
+                    current.pop(name)
+    else:
+        print(f"Resized cache is up to date ({len(current)} images).")
+
+    # Captions are tiny, copy any whose size or mtime differ from the cached copy,
+    # and drop cached ones whose source caption was deleted so kohya does not train on them
+    for name in current:
+        caption = dataset / (os.path.splitext(name)[0] + ".txt")
+        cached_caption = cache_dir / caption.name
+        if not caption.exists():
+            if cached_caption.exists():
+                cached_caption.unlink()
+            continue
+        source_stat = caption.stat()
+        if cached_caption.exists():
+            cached_stat = cached_caption.stat()
+            if cached_stat.st_size == source_stat.st_size and cached_stat.st_mtime_ns == source_stat.st_mtime_ns:
+                continue
+        shutil.copy2(caption, cached_caption)
+
+    # Captions left from images that failed to resize or predate the index
+    stems = {os.path.splitext(name)[0] for name in current}
+    for entry in cache_dir.glob("*.txt"):
+        if entry.stem not in stems:
+            entry.unlink()
+
+    save_manifest(index_path, current)
+    return cache_dir
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python dataset_resize.py <dataset_path> <resolution>")
+    else:
+        print(f"Resized cache: {build_resized_cache(sys.argv[1], int(sys.argv[2]))}")
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from file_utils import hash_file
+
+# Latent and text-encoder outputs shared by every training run, keyed by content rather than path
+default_store_path = Path.home() / ".grloratrainer" / "encoder_cache"
+hash_memo_name = ".encoder_cache_hashes.json"
+valid_exts = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+# File names kohya's Flux caching strategies write next to each image
+latents_pattern = re.compile(r"^(?P<stem>.+)(?P<suffix>_\d{4}x\d{4}_flux\.npz)$")
+text_encoder_pattern = re.compile(r"^(?P<stem>.+)(?P<suffix>_flux_te\.npz)$")
+# kohya options that change what it caches, so they are part of the store keys alongside the models
+latents_flags = ("--flip_aug", "--alpha_mask")
+text_encoder_flags = ("--apply_t5_attn_mask", "--t5xxl_max_token_length")
+# Bumped when the store layout or keys change, entries written by older versions are not reused
+store_version = 2
+
+def settings_key(*parts):
+    """
+    Short digest of the model paths and settings an encoder output depends on.
+    """
+    return hashlib.sha256("\n".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+def cache_flags(command, flags):
+    """
+    Returns the arguments of 'command' that set one of 'flags', sorted.
+    """
+    return sorted(arg for arg in command or () if arg.split("=", 1)[0] in flags)
+
+def is_up_to_date(cache_path, source_path):
+    """
+    True if a cache file was written after the image or caption it was made from.
+    """
+    try:
+        return os.stat(cache_path).st_mtime >= os.stat(source_path).st_mtime
+    except OSError:
+        return False
+
+def copy_from_store(source, destination):
+    """
+    Copies a stored file into a dataset folder. A copy rather than a hard link, since kohya rewrites
+    outdated cache files in place and would otherwise overwrite the store for every dataset.
+    """
+    tmp_path = destination.with_name(destination.name + ".tmp")
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+def image_hashes(image_dir):
+    """
+    Returns {stem: (image path, content hash)} for the images in 'image_dir'.
+    Hashes are remembered by size and mtime in a small file in the folder, so unchanged images are not re-read.
+    """
+    image_dir = Path(image_dir)
+    memo_path = image_dir / hash_memo_name
+    try:
+        with open(memo_path, "r", encoding="utf-8") as f:
+            memo = json.load(f)
+    except (OSError, ValueError):
+        memo = {}
+
+    hashes = {}
+    updated = {}
+    for entry in os.scandir(image_dir):
+        stem, ext = os.path.splitext(entry.name)
+        if not entry.is_file() or ext.lower() not in valid_exts:
+            continue
+        stat = entry.stat()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        known = memo.get(entry.name)
+        digest = known["hash"] if known and known["signature"] == signature else hash_file(entry.path)
+        updated[entry.name] = {"signature": signature, "hash": digest}
+        hashes[stem] = (Path(entry.path), digest)
+
+    if updated != memo:
+        with open(memo_path, "w", encoding="utf-8") as f:
+            json.dump(updated, f)
+    return hashes
+
+def caption_hash(image_path):
+    """
+    Hashes the caption that goes with an image, or returns None if it has none.
+    """
+    try:
+        return hashlib.sha256(image_path.with_suffix(".txt").read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+class EncoderCache:
+    """
+    Content-addressed store of kohya's cached VAE latents and text-encoder outputs.
+    Latents are keyed by image hash, resolution, VAE and the flags that change them; text-encoder
+    outputs by caption hash, the CLIP-L/T5 models and their flags, so a retrain on an unchanged
+    dataset skips both encoding passes.
+    """
+    def __init__(self, resolution, ae_path, clip_path, t5_path, command=None, store_path=default_store_path):
+        self.latents_dir = Path(store_path) / "latents" / settings_key(
+            store_version, resolution, ae_path, *cache_flags(command, latents_flags))
+        self.text_encoder_dir = Path(store_path) / "text_encoder" / settings_key(
+            store_version, clip_path, t5_path, *cache_flags(command, text_encoder_flags))
+        self.latents_dir.mkdir(parents=True, exist_ok=True)
+        self.text_encoder_dir.mkdir(parents=True, exist_ok=True)
+
+    def store(self, image_dir, hashes=None):
+        """
+        Adds the cache files kohya has written in 'image_dir' to the store. Returns the number added.
+        Only files newer than their image or caption are taken, an output left from before an edit
+        would otherwise be filed under the new content's hash.
+        """
+        hashes = hashes if hashes is not None else image_hashes(image_dir)
+        added = 0
+        for entry in os.scandir(image_dir):
+            match = latents_pattern.match(entry.name)
+            if match and match.group("stem") in hashes:
+                image_path, digest = hashes[match.group("stem")]
+                source_path = image_path
+                target = self.latents_dir / (digest + match.group("suffix"))
+            else:
+                match = text_encoder_pattern.match(entry.name)
+                if not match or match.group("stem") not in hashes:
+                    continue
+                source_path = hashes[match.group("stem")][0].with_suffix(".txt")
+                digest = caption_hash(hashes[match.group("stem")][0])
+                if digest is None:
+                    continue
+                target = self.text_encoder_dir / (digest + match.group("suffix"))
+            if not target.exists() and is_up_to_date(entry.path, source_path):
+                tmp_path = target.with_name(target.name + ".tmp")
+                shutil.copy2(entry.path, tmp_path)
+                os.replace(tmp_path, target)
+                added += 1
+        return added
+
+    def copy_in(self, image_dir, hashes=None):
+        """
+        Copies stored cache files next to the images in 'image_dir' under the names kohya expects,
+        where the folder has none or only one older than its image or caption.
+        Returns (latents copied, text-encoder outputs copied).
+        """
+        hashes = hashes if hashes is not None else image_hashes(image_dir)
+        image_dir = Path(image_dir)
+
+        stored_latents = {}
+        for entry in os.scandir(self.latents_dir):
+            match = re.match(r"^([0-9a-f]{64})(_\d{4}x\d{4}_flux\.npz)$", entry.name)
+            if match:
+                stored_latents.setdefault(match.group(1), []).append((entry.path, match.group(2)))
+
+        latents = text_encoder = 0
+        for stem, (image_path, digest) in hashes.items():
+            for source, suffix in stored_latents.get(digest, []):
+                destination = image_dir / (stem + suffix)
+                if not is_up_to_date(destination, image_path):
+                    copy_from_store(source, destination)
+                    latents += 1
+
+            caption_digest = caption_hash(image_path)
+            if caption_digest is None:
+                continue
+            source = self.text_encoder_dir / (caption_digest + "_flux_te.npz")
+            destination = image_dir / (stem + "_flux_te.npz")
+            if source.exists() and not is_up_to_date(destination, image_path.with_suffix(".txt")):
+                copy_from_store(source, destination)
+                text_encoder += 1
+        return latents, text_encoder
+
+def prepare_encoder_cache(image_dir, resolution, ae_path, clip_path, t5_path, command=None):
+    """
+    Before training: saves any cache files already in 'image_dir' to the shared store, then copies
+    in stored ones for images and captions seen in earlier runs. 'command' is the training command,
+    whose caching flags are part of the store keys. Returns the EncoderCache.
+    """
+    cache = EncoderCache(resolution, ae_path, clip_path, t5_path, command)
+    hashes = image_hashes(image_dir)
+    cache.store(image_dir, hashes)
+    latents, text_encoder = cache.copy_in(image_dir, hashes)
+    if latents or text_encoder:
+        print(f"Reused {latents} cached latents and {text_encoder} cached text-encoder outputs from earlier runs.")
+    return cache
+
+if __name__ == "__main__":
+    if len(sys.argv) < 6:
+        print("Usage: python encoder_cache.py <image_dir> <resolution> <ae_path> <clip_l_path> <t5_path> [kohya caching flags]")
+    else:
+        cache = prepare_encoder_cache(*sys.argv[1:6], command=sys.argv[6:])
+        print(f"Stored {cache.store(sys.argv[1])} new cache files.")
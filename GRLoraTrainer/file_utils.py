@@ -0,0 +1,22 @@
+import hashlib
+import os
+import shutil
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(source, destination):
+    """
+    Hard-links 'source' to 'destination', copying when the two are on different drives.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
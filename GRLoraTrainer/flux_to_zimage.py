@@ -0,0 +1,234 @@
+import argparse
+import re
+import sys
+import time
+import numpy as np
+from lora_io import SafeTensorsFile, SafeTensorsWriter, read_header, lora_modules
+from lora_index import detect_family
+from lora_merge import save_dtype
+
+# Z-Image transformer layout, as in zimagelora.txt: 30 layers, 3840 wide, 10240 wide feed-forward
+zimage_layer_count = 30
+zimage_hidden = 3840
+zimage_ff = 10240
+# (in_features, out_features) of each Z-Image module the converter writes
+zimage_modules = {
+    "attention_to_q": (zimage_hidden, zimage_hidden),
+    "attention_to_k": (zimage_hidden, zimage_hidden),
+    "attention_to_v": (zimage_hidden, zimage_hidden),
+    "attention_to_out_0": (zimage_hidden, zimage_hidden),
+    "feed_forward_w1": (zimage_hidden, zimage_ff),
+    "feed_forward_w2": (zimage_ff, zimage_hidden),
+    "feed_forward_w3": (zimage_hidden, zimage_ff),
+}
+# The fused layout zimagelora.txt itself uses, accepted by verify_zimage_structure
+zimage_fused_modules = {
+    "attention_qkv": (zimage_hidden, 3 * zimage_hidden),
+    "attention_out": (zimage_hidden, zimage_hidden),
+    "feed_forward_w1": (zimage_hidden, zimage_ff),
+    "feed_forward_w2": (zimage_ff, zimage_hidden),
+    "feed_forward_w3": (zimage_hidden, zimage_ff),
+}
+
+# Flux double-block module -> [(Z-Image module, third of lora_up to take or None for all of it)].
+# The fused qkv up projection is split into its q, k and v thirds, sharing lora_down and alpha.
+# mlp_0 projects into the feed-forward width like w1 and w3, mlp_2 back out of it like w2.
+module_map = {
+    "attn_qkv": [("attention_to_q", 0), ("attention_to_k", 1), ("attention_to_v", 2)],
+    "attn_proj": [("attention_to_out_0", None)],
+    "mlp_0": [("feed_forward_w1", None), ("feed_forward_w3", None)],
+    "mlp_2": [("feed_forward_w2", None)],
+}
+
+def offset_layer_map():
+    """
+    Z-Image layer -> Flux double block: layers 0-10 take Flux blocks 0-10 and layers 11-29
+    take Flux blocks 0-18, the offset mapping from the testing.txt experiments.
+    """
+    return {layer: layer if layer <= 10 else layer - 11 for layer in range(zimage_layer_count)}
+
+def build_conversion_table(flux_modules, stream="img", layer_map=None):
+    """
+    Precomputes the conversion as a list of (output module, Z-Image module, Flux module parts,
+    qkv third or None), in output order. Missing Flux modules are skipped.
+    """
+    layer_map = layer_map or offset_layer_map()
+    table = []
+    for layer in range(zimage_layer_count):
+        for flux_module, targets in module_map.items():
+            source = f"lora_unet_double_blocks_{layer_map[layer]}_{stream}_{flux_module}"
+            parts = flux_modules.get(source)
+            if not parts or "lora_down" not in parts or "lora_up" not in parts:
+                continue
+            for target, third in targets:
+                table.append((f"lora_unet_layers_{layer}_{target}", target, parts, third))
+    table.sort(key=lambda row: [int(p) if p.isdigit() else p for p in re.split(r"(\d+)", row[0])])
+    return table
+
+def fit_width(array, axis, size):
+    """
+    Zero-pads or truncates 'array' along 'axis' to 'size'.
+    """
+    current = array.shape[axis]
+    if current == size:
+        return array
+    if current > size:
+        return np.take(array, np.arange(size), axis=axis)
+    padding = [(0, 0)] * array.ndim
+    padding[axis] = (0, size - current)
+    return np.pad(array, padding)
+
+def converted_shapes(flux, parts, third, zimage_module, fit):
+    """
+    Output (down shape, up shape) of one converted module.
+    """
+    down_shape = flux.shape(parts["lora_down"])
+    up_shape = flux.shape(parts["lora_up"])
+    out_features = up_shape[0] // 3 if third is not None else up_shape[0]
+    in_features = down_shape[1]
+    if fit:
+        in_features, out_features = zimage_modules[zimage_module]
+    return (down_shape[0], in_features), (out_features, up_shape[1])
+
+def convert_flux_to_zimage(flux_path, output_path, stream="img", fit=True, save_precision=None, layer_map=None):
+    """
+    Converts a kohya Flux LoRA into Z-Image key layout, reading tensors lazily from the memory-mapped
+    input and writing each converted module straight to the output.
+
+    Flux is 3072 wide and Z-Image 3840, so with 'fit' each factor's feature dimension is zero-padded
+    (or truncated, for Flux's wider MLP) to the Z-Image width so the result loads; the transfer is
+    an experiment, not an equivalent model. Without 'fit' the Flux widths are kept, the output will not
+    load into Z-Image and the structure check reports every width mismatch.
+    Flux's single blocks are not converted: their linear1 fuses qkv with the MLP input and linear2
+    fuses the attention output with the MLP output, which has no counterpart among Z-Image's modules.
+    Returns a summary including the structure check of the output and the number of single-block
+    modules dropped.
+    """
+    start_time = time.time()
+    flux = SafeTensorsFile(flux_path)
+    try:
+        if detect_family(flux.keys()) != "flux":
+            raise ValueError(f"{flux_path} is not a kohya Flux LoRA")
+        flux_modules, _ = lora_modules(flux.keys())
+        table = build_conversion_table(flux_modules, stream, layer_map)
+        dropped = sum(1 for module in flux_modules if module.startswith("lora_unet_single_blocks_"))
+        if not table:
+            raise ValueError(f"{flux_path} has no double-block {stream} modules to convert")
+
+        specs = {}
+        shapes = {}
+        for target, zimage_module, parts, third in table:
+            dtype = save_dtype(save_precision) if save_precision else flux.dtype(parts["lora_down"])
+            down_shape, up_shape = converted_shapes(flux, parts, third, zimage_module, fit)
+            shapes[target] = (down_shape, up_shape)
+            specs[f"{target}.lora_down.weight"] = (dtype, down_shape)
+            specs[f"{target}.lora_up.weight"] = (dtype, up_shape)
+            specs[f"{target}.alpha"] = (dtype, ())
+
+        metadata = {"ss_network_module": "networks.lora", "ss_converted_from": "flux", "ss_conversion_stream": stream}
+        writer = SafeTensorsWriter(output_path, specs, metadata)
+        try:
+            for target, _, parts, third in table:
+                down_shape, up_shape = shapes[target]
+                down = flux.get(parts["lora_down"])
+                up = flux.get(parts["lora_up"])
+                if third is not None:
+                    # A view of the q, k or v rows, no copy
+                    up = up.reshape(3, -1, up.shape[1])[third]
+                writer.write(f"{target}.lora_down.weight", fit_width(down, 1, down_shape[1]))
+                writer.write(f"{target}.lora_up.weight", fit_width(up, 0, up_shape[0]))
+                alpha = flux.get(parts["alpha"]) if "alpha" in parts else np.array(down.shape[0], dtype=np.float32)
+                writer.write(f"{target}.alpha", alpha.reshape(()))
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+    finally:
+        flux.close()
+
+    problems = verify_zimage_structure(output_path)
+    return {
+        "output": output_path,
+        "modules": len(table),
+        "keys": len(specs),
+        "dropped_single_blocks": dropped,
+        "problems": problems,
+        "seconds": time.time() - start_time,
+    }
+
+def verify_zimage_structure(lora_path, check_widths=True):
+    """
+    Checks a LoRA against the Z-Image layout of zimagelora.txt from its header: every one of the 30 layers
+    has each attention and feed-forward module with lora_down, lora_up and alpha, ranks agree, and
+    (with 'check_widths') the feature widths match Z-Image. Accepts both the split to_q/k/v/out_0 layout
+    and the fused attention_qkv/attention_out one. Returns a list of problems, empty if the structure is valid.
+    """
+    tensors, _, _ = read_header(lora_path)
+    found, others = lora_modules(tensors)
+    expected = zimage_fused_modules if any(m.endswith("_attention_qkv") for m in found) else zimage_modules
+
+    problems = [f"unexpected key: {key}" for key in others]
+    pattern = re.compile(r"^lora_unet_layers_(\d+)_(.+)$")
+    for module in found:
+        match = pattern.match(module)
+        if not match or match.group(2) not in expected or int(match.group(1)) >= zimage_layer_count:
+            problems.append(f"unexpected module: {module}")
+
+    for layer in range(zimage_layer_count):
+        for name, (in_features, out_features) in expected.items():
+            module = f"lora_unet_layers_{layer}_{name}"
+            parts = found.get(module)
+            if not parts:
+                problems.append(f"missing module: {module}")
+                continue
+            missing = [p for p in ("lora_down", "lora_up", "alpha") if p not in parts]
+            if missing:
+                problems.append(f"{module}: missing {', '.join(missing)}")
+                continue
+            down_shape = tensors[parts["lora_down"]]["shape"]
+            up_shape = tensors[parts["lora_up"]]["shape"]
+            if len(down_shape) != 2 or len(up_shape) != 2 or down_shape[0] != up_shape[1]:
+                problems.append(f"{module}: lora_down {down_shape} and lora_up {up_shape} do not pair")
+            elif check_widths and (down_shape[1] != in_features or up_shape[0] != out_features):
+                problems.append(f"{module}: maps {down_shape[1]} -> {up_shape[0]}, "
+                                f"Z-Image expects {in_features} -> {out_features}")
+    return problems
+
+def print_problems(problems, limit=20):
+    if not problems:
+        print("Structure matches the Z-Image layout.")
+        return
+    print(f"{len(problems)} structure problem(s):")
+    for problem in problems[:limit]:
+        print(f"  {problem}")
+    if len(problems) > limit:
+        print(f"  ... and {len(problems) - limit} more")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a kohya Flux LoRA to the Z-Image layout, or verify a Z-Image LoRA.")
+    parser.add_argument("input", help="Flux LoRA to convert, or the LoRA to check with --verify")
+    parser.add_argument("output", nargs="?", help="Converted Z-Image LoRA")
+    parser.add_argument("--verify", action="store_true", help="Only check 'input' against the Z-Image layout")
+    parser.add_argument("--stream", choices=["img", "txt"], default="img", help="Flux double-block stream to convert")
+    parser.add_argument("--keep_widths", action="store_true",
+                        help="Keep Flux's feature widths instead of fitting Z-Image's, the output will not load into Z-Image")
+    parser.add_argument("--save_precision", default=None, help="fp16, bf16 or fp32 (default: same as the input)")
+    args = parser.parse_args()
+
+    try:
+        if args.verify:
+            problems = verify_zimage_structure(args.input)
+        elif not args.output:
+            parser.error("an output path is needed to convert")
+        else:
+            summary = convert_flux_to_zimage(args.input, args.output, args.stream, not args.keep_widths, args.save_precision)
+            print(f"Wrote {summary['keys']} keys to {summary['output']} in {summary['seconds']:.2f}s")
+            if summary["dropped_single_blocks"]:
+                print(f"Warning: {summary['dropped_single_blocks']} single-block modules were dropped, "
+                      "Z-Image has no counterpart for them")
+            problems = summary["problems"]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print_problems(problems)
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from lora_io import read_header, lora_modules
+from lora_index import detect_family
+
+rule = "=" * 80
+dtype_names = {"F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16"}
+
+def module_category(module):
+    """
+    Sorts a module into the groups used by the analyzer reports: attention, feed-forward or other.
+    """
+    if "attn" in module or "attention" in module:
+        return "attention"
+    if "mlp" in module or "feed_forward" in module or "_ff_" in module:
+        return "feed_forward"
+    return "other"
+
+def natural_key(text):
+    """
+    Sort key that orders "layers_2" before "layers_10".
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", text)]
+
+def analyze_lora(path):
+    """
+    Analyzes a LoRA from its safetensors header alone. Returns a dict with key and parameter totals,
+    family, dtypes, ranks, per-category key counts and every module with its keys.
+    """
+    start_time = time.perf_counter()
+    tensors, metadata, _ = read_header(path)
+    params = {key: int(np.prod(info["shape"], dtype=np.int64)) for key, info in tensors.items()}
+    found, others = lora_modules(tensors)
+
+    modules = []
+    for module in sorted(found, key=natural_key):
+        parts = found[module]
+        keys = sorted(parts.values(), key=natural_key)
+        rank = tensors[parts["lora_down"]]["shape"][0] if "lora_down" in parts else None
+        modules.append({
+            "name": module,
+            "category": module_category(module),
+            "rank": rank,
+            "params": sum(params[key] for key in keys),
+            "keys": keys,
+        })
+
+    categories = Counter()
+    for module in modules:
+        categories[module["category"]] += len(module["keys"])
+    categories["other"] += len(others)
+
+    return {
+        "file": os.path.basename(path),
+        "path": os.path.abspath(path),
+        "family": detect_family(tensors),
+        "total_keys": len(tensors),
+        "total_params": sum(params.values()),
+        "dtypes": dict(Counter(info["dtype"] for info in tensors.values())),
+        "ranks": dict(Counter(m["rank"] for m in modules if m["rank"] is not None)),
+        "attention_keys": categories["attention"],
+        "feed_forward_keys": categories["feed_forward"],
+        "other_keys": categories["other"],
+        "modules": modules,
+        "unpaired_keys": sorted(others, key=natural_key),
+        "tensors": {key: {"shape": info["shape"], "dtype": info["dtype"], "params": params[key]}
+                    for key, info in sorted(tensors.items(), key=lambda item: natural_key(item[0]))},
+        "metadata": metadata,
+        "analysis_ms": round((time.perf_counter() - start_time) * 1000, 2),
+    }
+
+def format_report(analysis, detailed=False, first=100):
+    """
+    Formats an analysis as a text report in the style of the bundled analyzer reports.
+    """
+    lines = [rule, f"MODEL ANALYSIS: {analysis['file']}", f"Full path: {analysis['path']}", rule, ""]
+    lines.append(f"Total keys: {analysis['total_keys']}")
+    lines.append(f"Total parameters: {analysis['total_params']:,}")
+    lines.append(f"Family: {analysis['family']}")
+    lines.append("Dtypes: " + ", ".join(f"{dtype_names.get(d, d)} ({n})" for d, n in analysis["dtypes"].items()))
+    lines.append("Ranks: " + (", ".join(f"{r} ({n} modules)" for r, n in sorted(analysis["ranks"].items())) or "none"))
+    lines.append(f"Feed-forward keys: {analysis['feed_forward_keys']}")
+    lines.append(f"Attention keys: {analysis['attention_keys']}")
+    lines.append(f"Other keys: {analysis['other_keys']}")
+
+    keys = list(analysis["tensors"].items())
+    shown = keys if detailed else keys[:first]
+    title = f"ALL KEYS ({len(keys)})" if detailed or len(keys) <= first else f"FIRST {first} KEYS (use --detailed for all {len(keys)} keys)"
+    lines += ["", rule, title, rule]
+    for number, (key, info) in enumerate(shown, start=1):
+        lines.append(f"{number:>4}. {key}: {info['shape']} ({dtype_names.get(info['dtype'], info['dtype'])})")
+    if len(shown) < len(keys):
+        lines += ["", f"... and {len(keys) - len(shown)} more keys (use --detailed to see all)"]
+
+    for category, heading in (("attention", "ATTENTION MODULES"), ("feed_forward", "FEED-FORWARD MODULES"), ("other", "OTHER MODULES")):
+        group = [m for m in analysis["modules"] if m["category"] == category]
+        if not group:
+            continue
+        lines += ["", rule, f"{heading} ({len(group)})", rule]
+        for module in group:
+            if detailed:
+                lines += ["", f"{module['name']}.*:  rank {module['rank']}, {module['params']:,} parameters"]
+                lines += [f"  +-- {key}" for key in module["keys"]]
+            else:
+                lines.append(f"  {module['name']}: {len(module['keys'])} keys, rank {module['rank']}, {module['params']:,} parameters")
+
+    if analysis["unpaired_keys"]:
+        lines += ["", rule, f"KEYS OUTSIDE LORA MODULES ({len(analysis['unpaired_keys'])})", rule]
+        lines += [f"  {key}" for key in analysis["unpaired_keys"]]
+    if detailed and analysis["metadata"]:
+        lines += ["", rule, "METADATA", rule]
+        lines += [f"  {name}: {value[:200]}" for name, value in sorted(analysis["metadata"].items())]
+    lines += ["", f"Analyzed from the header in {analysis['analysis_ms']} ms"]
+    return "\n".join(lines)
+
+def analyze_paths(paths, workers=8):
+    """
+    Analyzes several files on a thread pool. Yields (path, analysis or None, error or None) in order.
+    """
+    def safe_analyze(path):
+        try:
+            return path, analyze_lora(path), None
+        except (OSError, ValueError) as e:
+            return path, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(safe_analyze, paths)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze the structure of LoRA files from their safetensors headers.")
+    parser.add_argument("paths", nargs="+", help=".safetensors files or folders of them")
+    parser.add_argument("--detailed", action="store_true", help="List every key and each module's keys")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of text")
+    parser.add_argument("--output", default=None, help="Write the report to this file")
+    parser.add_argument("--workers", type=int, default=8, help="Threads used for folders")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".safetensors"))
+        else:
+            files.append(path)
+
+    reports = []
+    results = []
+    for path, analysis, error in analyze_paths(files, args.workers):
+        if error:
+            results.append({"path": os.path.abspath(path), "error": error})
+            reports.append(f"{rule}\nMODEL ANALYSIS: {os.path.basename(path)}\nError: {error}")
+            continue
+        if args.json:
+            if not args.detailed:
+                analysis.pop("tensors")
+                analysis.pop("metadata")
+            results.append(analysis)
+        else:
+            reports.append(format_report(analysis, args.detailed))
+
+    if args.json:
+        output = json.dumps(results[0] if len(results) == 1 else results, indent=1)
+    else:
+        header = "\n".join([rule, "COMPREHENSIVE MODEL ANALYZER", rule])
+        footer = "\n".join([rule, "ANALYSIS COMPLETE", rule])
+        output = "\n\n".join([header] + reports + [footer])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Report for {len(files)} file(s) written to {args.output}")
+    else:
+        print(output)
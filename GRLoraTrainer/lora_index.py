@@ -0,0 +1,181 @@
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from lora_io import read_header
+
+index_name = ".lora_index.json"
+
+# Architecture families recognised from kohya key prefixes
+family_prefixes = [
+    ("flux", ("lora_unet_double_blocks_", "lora_unet_single_blocks_")),
+    ("zimage", ("lora_unet_layers_",)),
+    ("sdxl", ("lora_te1_", "lora_te2_", "lora_unet_input_blocks_", "lora_unet_output_blocks_")),
+    ("sd1", ("lora_te_", "lora_unet_down_blocks_", "lora_unet_up_blocks_")),
+]
+# Metadata fields that hold trigger words, in the order they are trusted
+trigger_fields = ("modelspec.trigger_phrase", "ss_trigger_words", "ss_training_comment")
+
+def detect_family(keys):
+    """
+    Returns the architecture family of a LoRA from its key names, "diffusers" for lora_A/lora_B
+    style keys and "unknown" otherwise.
+    """
+    counts = Counter()
+    for key in keys:
+        for family, prefixes in family_prefixes:
+            if key.startswith(prefixes):
+                counts[family] += 1
+                break
+    if counts:
+        return counts.most_common(1)[0][0]
+    if any(".lora_A." in key or ".lora_B." in key for key in keys):
+        return "diffusers"
+    return "unknown"
+
+def top_tags(metadata, count=10):
+    """
+    Returns the most frequent caption tags recorded in kohya's ss_tag_frequency metadata.
+    """
+    try:
+        frequency = json.loads(metadata.get("ss_tag_frequency", "{}"))
+    except ValueError:
+        return []
+    tags = Counter()
+    for folder_tags in frequency.values():
+        if isinstance(folder_tags, dict):
+            for tag, seen in folder_tags.items():
+                tags[tag.strip()] += seen if isinstance(seen, int) else 1
+    return [tag for tag, _ in tags.most_common(count) if tag]
+
+def describe_lora(path):
+    """
+    Summarises a LoRA from its safetensors header alone, without touching tensor data.
+    """
+    tensors, metadata, _ = read_header(path)
+    keys = list(tensors)
+    ranks = Counter(info["shape"][0] for key, info in tensors.items()
+                    if key.endswith(("lora_down.weight", "lora_A.weight")) and info["shape"])
+    dtypes = Counter(info["dtype"] for info in tensors.values())
+    triggers = next((metadata[f].strip() for f in trigger_fields if metadata.get(f, "").strip()), "")
+    return {
+        "family": detect_family(keys),
+        "rank": ranks.most_common(1)[0][0] if ranks else None,
+        "ranks": sorted(ranks),
+        "keys": len(keys),
+        "params": int(sum(int(np.prod(info["shape"], dtype=np.int64)) for info in tensors.values())),
+        "dtype": dtypes.most_common(1)[0][0] if dtypes else None,
+        "triggers": triggers,
+        "tags": top_tags(metadata),
+        "base_model": metadata.get("ss_base_model_version", metadata.get("modelspec.architecture", "")),
+    }
+
+def merge_group(entry):
+    """
+    (family, rank) of an index entry. LoRAs can only be merged by summing, without concat, when
+    they share it. None for unreadable files and LoRAs whose modules have different ranks.
+    """
+    if "error" in entry or len(entry.get("ranks", [])) != 1:
+        return None
+    return entry["family"], entry["rank"]
+
+def load_index(folder_path):
+    try:
+        with open(os.path.join(folder_path, index_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(folder_path, index):
+    path = os.path.join(folder_path, index_name)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def update_index(folder_path, workers=16):
+    """
+    Brings the index of the LoRAs in 'folder_path' up to date and returns it as {file name: entry}.
+    Only files whose size or mtime changed since the last refresh have their header read,
+    on a thread pool since the work is all small reads.
+    """
+    previous = load_index(folder_path)
+    index = {}
+    stale = []
+    for entry in os.scandir(folder_path):
+        if not entry.is_file() or not entry.name.endswith(".safetensors"):
+            continue
+        stat = entry.stat()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        known = previous.get(entry.name)
+        if known and known.get("signature") == signature:
+            index[entry.name] = known
+        else:
+            stale.append((entry.name, entry.path, signature))
+
+    def read(item):
+        name, path, signature = item
+        try:
+            described = describe_lora(path)
+        except (OSError, ValueError) as e:
+            described = {"error": str(e)}
+        described["signature"] = signature
+        described["size"] = signature[0]
+        return name, described
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            index.update(pool.map(read, stale))
+    if index != previous:
+        save_index(folder_path, index)
+    return index
+
+def matches(name, entry, terms):
+    """
+    True if a LoRA matches every search term. "rank:N", "family:X" and "dtype:X" match those
+    fields exactly, other terms are looked for in the name, family, triggers and tags.
+    """
+    text = " ".join([name, entry.get("family", ""), entry.get("triggers", ""), " ".join(entry.get("tags", []))]).lower()
+    for term in terms:
+        field, _, value = term.partition(":")
+        if value and field in ("rank", "family", "dtype"):
+            if str(entry.get(field, "")).lower() != value:
+                return False
+        elif term not in text:
+            return False
+    return True
+
+def search_index(index, query=""):
+    """
+    Returns the sorted file names in 'index' matching 'query', skipping unreadable files.
+    """
+    terms = query.lower().split()
+    return sorted(name for name, entry in index.items() if "error" not in entry and matches(name, entry, terms))
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+def describe_line(name, entry):
+    """
+    One line summary of an indexed LoRA for the merge menus.
+    """
+    rank = entry.get("rank") if len(entry.get("ranks", [])) <= 1 else "/".join(map(str, entry["ranks"]))
+    line = f"{name}  [{entry.get('family')} r{rank} {entry.get('dtype')} {format_size(entry.get('size', 0))}]"
+    if entry.get("triggers"):
+        line += f"  {entry['triggers'][:40]}"
+    return line
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python lora_index.py <lora_folder> [search terms, e.g. flux rank:4 portrait]")
+    else:
+        index = update_index(sys.argv[1])
+        found = search_index(index, " ".join(sys.argv[2:]))
+        for name in found:
+            print(describe_line(name, index[name]))
+        print(f"\n{len(found)} of {len(index)} LoRAs match.")
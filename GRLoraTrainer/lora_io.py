@@ -0,0 +1,177 @@
+import json
+import os
+import struct
+import numpy as np
+
+# safetensors dtype names and their sizes in bytes
+dtype_sizes = {
+    "F64": 8, "F32": 4, "F16": 2, "BF16": 2,
+    "I64": 8, "I32": 4, "I16": 2, "I8": 1, "U8": 1, "BOOL": 1,
+}
+numpy_dtypes = {
+    "F64": np.float64, "F32": np.float32, "F16": np.float16, "BF16": np.uint16,
+    "I64": np.int64, "I32": np.int32, "I16": np.int16, "I8": np.int8, "U8": np.uint8, "BOOL": np.bool_,
+}
+# Names accepted for save precision, as used by the kohya merge scripts
+precision_dtypes = {"fp32": "F32", "float": "F32", "fp16": "F16", "float16": "F16", "bf16": "BF16"}
+
+def read_header(path):
+    """
+    Reads only the JSON header of a .safetensors file.
+    Returns (tensors, metadata, data_start) where tensors maps each key to its dtype, shape and data_offsets.
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError(f"{path} is too short to be a safetensors file")
+        header_size = struct.unpack("<Q", prefix)[0]
+        if header_size > 100 * 1024 * 1024:
+            raise ValueError(f"{path} has an implausible header size ({header_size} bytes)")
+        header = json.loads(f.read(header_size))
+    metadata = header.pop("__metadata__", None) or {}
+    return header, metadata, 8 + header_size
+
+def bf16_to_float32(raw):
+    """
+    Widens raw bfloat16 bits (uint16) to float32.
+    """
+    return (raw.astype(np.uint32) << 16).view(np.float32)
+
+def float32_to_bf16(values):
+    """
+    Narrows float32 to bfloat16 bits (uint16) with round-to-nearest-even, as torch does.
+    """
+    bits = np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)
+    rounded = ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    return np.where(np.isnan(values), np.uint16(0x7FC0), rounded)
+
+def to_storage(values, dtype):
+    """
+    Converts a float array to the raw array stored for safetensors 'dtype'.
+    """
+    if dtype == "BF16":
+        return float32_to_bf16(values)
+    return np.ascontiguousarray(values, dtype=numpy_dtypes[dtype])
+
+class SafeTensorsFile:
+    """
+    Memory-mapped, read-only view of a .safetensors file. Tensors are only read from disk
+    when asked for, so opening a file costs one header read whatever its size.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self.tensors, self.metadata, self.data_start = read_header(self.path)
+        self._map = np.memmap(self.path, dtype=np.uint8, mode="r") if os.path.getsize(self.path) > self.data_start else None
+
+    def keys(self):
+        return self.tensors.keys()
+
+    def __contains__(self, key):
+        return key in self.tensors
+
+    def shape(self, key):
+        return tuple(self.tensors[key]["shape"])
+
+    def dtype(self, key):
+        return self.tensors[key]["dtype"]
+
+    def raw(self, key):
+        """
+        Returns the tensor as a read-only array of its stored type, still backed by the file.
+        """
+        info = self.tensors[key]
+        begin, end = info["data_offsets"]
+        data = self._map[self.data_start + begin:self.data_start + end]
+        return data.view(numpy_dtypes[info["dtype"]]).reshape(info["shape"])
+
+    def get(self, key, dtype=np.float32):
+        """
+        Returns the tensor converted to 'dtype' (float32 by default) in memory.
+        """
+        raw = self.raw(key)
+        if self.tensors[key]["dtype"] == "BF16":
+            raw = bf16_to_float32(raw)
+        return np.array(raw, dtype=dtype)
+
+    def close(self):
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SafeTensorsWriter:
+    """
+    Writes a .safetensors file one tensor at a time. Every tensor's dtype and shape is declared up front
+    so the header can be written first, then the tensors are written in that order and dropped,
+    keeping memory to one tensor. The file is written under a temporary name and renamed on close.
+    """
+    def __init__(self, path, specs, metadata=None):
+        self.path = str(path)
+        self.tmp_path = self.path + ".tmp"
+        self.order = list(specs)
+        self.specs = {}
+        header = {}
+        if metadata:
+            header["__metadata__"] = {str(k): str(v) for k, v in metadata.items()}
+        offset = 0
+        for key in self.order:
+            dtype, shape = specs[key]
+            size = dtype_sizes[dtype] * int(np.prod(shape, dtype=np.int64))
+            header[key] = {"dtype": dtype, "shape": list(shape), "data_offsets": [offset, offset + size]}
+            self.specs[key] = (dtype, tuple(shape), size)
+            offset += size
+
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        # The data section must start on an 8-byte boundary
+        header_bytes += b" " * (-len(header_bytes) % 8)
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(struct.pack("<Q", len(header_bytes)))
+        self.file.write(header_bytes)
+        self.next_index = 0
+
+    def write(self, key, values):
+        """
+        Writes the next tensor, converting it to its declared dtype.
+        """
+        if self.next_index >= len(self.order) or self.order[self.next_index] != key:
+            expected = self.order[self.next_index] if self.next_index < len(self.order) else "nothing"
+            raise ValueError(f"Tensors must be written in declared order: expected {expected}, got {key}")
+        dtype, shape, size = self.specs[key]
+        values = np.asarray(values)
+        if values.shape != shape:
+            raise ValueError(f"{key}: declared shape {shape} but got {values.shape}")
+        data = to_storage(values, dtype).tobytes()
+        assert len(data) == size
+        self.file.write(data)
+        self.next_index += 1
+
+    def close(self):
+        self.file.close()
+        if self.next_index != len(self.order):
+            os.remove(self.tmp_path)
+            raise ValueError(f"Only {self.next_index} of {len(self.order)} tensors were written to {self.path}")
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def lora_modules(keys):
+    """
+    Groups LoRA keys by module: {module: {"lora_down": key, "lora_up": key, "alpha": key}}.
+    Keys that are not part of a down/up/alpha triple are returned separately.
+    """
+    modules = {}
+    others = []
+    for key in keys:
+        for part, suffix in (("lora_down", ".lora_down.weight"), ("lora_up", ".lora_up.weight"), ("alpha", ".alpha")):
+            if key.endswith(suffix):
+                modules.setdefault(key[:-len(suffix)], {})[part] = key
+                break
+        else:
+            others.append(key)
+    return modules, others
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from lora_io import SafeTensorsFile, SafeTensorsWriter, lora_modules, precision_dtypes
+
+def save_dtype(precision):
+    """
+    Maps a save precision name (fp16, bf16, fp32) to its safetensors dtype.
+    """
+    try:
+        return precision_dtypes[precision.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unsupported save precision '{precision}', use fp16, bf16 or fp32") from None
+
+def read_alpha(lora, module, parts):
+    """
+    Returns a module's alpha, which kohya treats as equal to the rank when it is not stored.
+    """
+    if "alpha" in parts:
+        return float(lora.get(parts["alpha"]).reshape(-1)[0])
+    return float(lora.shape(parts["lora_down"])[0])
+
+def plan_merge(loras, concat=False):
+    """
+    Reads only the headers and alphas of the opened inputs and works out the merged layout.
+    Returns (modules, skipped): modules maps each module to its output down/up shapes and the
+    (lora index, rank, alpha, parts) of every input that has it, in first-seen order.
+    """
+    modules = {}
+    skipped = []
+    for index, lora in enumerate(loras):
+        found, others = lora_modules(lora.keys())
+        complete = {m: p for m, p in found.items() if "lora_down" in p and "lora_up" in p}
+        if not complete:
+            raise ValueError(f"{lora.path} has no lora_down/lora_up pairs, diffusers-format LoRAs are not supported")
+        skipped.extend(f"{os.path.basename(lora.path)}: {key}" for key in others)
+        skipped.extend(f"{os.path.basename(lora.path)}: {m} (incomplete)" for m in found if m not in complete)
+
+        for module, parts in complete.items():
+            down_shape = lora.shape(parts["lora_down"])
+            up_shape = lora.shape(parts["lora_up"])
+            rank = down_shape[0]
+            entry = modules.setdefault(module, {"down_shape": down_shape, "up_shape": up_shape, "sources": []})
+            if concat:
+                if entry["sources"]:
+                    entry["down_shape"] = (entry["down_shape"][0] + rank,) + down_shape[1:]
+                    entry["up_shape"] = (up_shape[0], entry["up_shape"][1] + rank) + up_shape[2:]
+            elif down_shape != entry["down_shape"] or up_shape != entry["up_shape"]:
+                raise ValueError(
+                    f"{module} has shape {down_shape} in {lora.path} but {entry['down_shape']} in an earlier model, "
+                    "merge LoRAs of different ranks with concat"
+                )
+            entry["sources"].append((index, rank, read_alpha(lora, module, parts), parts))
+    return modules, skipped
+
+def merge_module(loras, ratios, entry, concat=False):
+    """
+    Merges one module's inputs in float32 and returns (down, up, alpha).
+
+    Without concat this follows kohya's merge_lora_models: each input's down and up are scaled by
+    sqrt(alpha / base_alpha) * ratio (the sign going on down only) and summed, keeping the first
+    model's alpha, which is what flux_merge_lora.py without --concat produces.
+    With concat the ranks are stacked instead, each pair scaled by sqrt(|ratio| * alpha / rank)
+    and alpha set to the new rank, so the result is exactly the ratio-weighted sum of the inputs' deltas.
+    """
+    down = up = None
+    base_alpha = entry["sources"][0][2]
+    downs, ups = [], []
+    for index, rank, alpha, parts in entry["sources"]:
+        ratio = ratios[index]
+        if concat:
+            scale = float(np.sqrt(abs(ratio) * alpha / rank))
+        else:
+            scale = float(np.sqrt(alpha / base_alpha)) * abs(ratio)
+        lora = loras[index]
+        down_part = lora.get(parts["lora_down"])
+        down_part *= np.copysign(scale, ratio)
+        up_part = lora.get(parts["lora_up"])
+        up_part *= scale
+        if concat:
+            downs.append(down_part)
+            ups.append(up_part)
+        elif down is None:
+            down, up = down_part, up_part
+        else:
+            down += down_part
+            up += up_part
+
+    if concat:
+        down = np.concatenate(downs, axis=0)
+        up = np.concatenate(ups, axis=1)
+        return down, up, float(down.shape[0])
+    return down, up, base_alpha
+
+def merge_opened(loras, ratios, save_to, save_precision="fp16", concat=False, shuffle=False, seed=None, log=print):
+    """
+    Merges already opened SafeTensorsFile inputs into 'save_to', one module at a time.
+    Each merged module is written straight to the output, so peak memory is about one layer
+    whatever the number of inputs. 'shuffle' permutes each merged module's rank dimension like
+    kohya's --shuffle. Returns a summary of the merge.
+    """
+    if len(loras) != len(ratios):
+        raise ValueError("Each model needs a ratio")
+    dtype = save_dtype(save_precision)
+    rng = np.random.default_rng(seed)
+    start_time = time.time()
+
+    modules, skipped = plan_merge(loras, concat)
+    specs = {}
+    for module, entry in modules.items():
+        specs[f"{module}.lora_down.weight"] = (dtype, entry["down_shape"])
+        specs[f"{module}.lora_up.weight"] = (dtype, entry["up_shape"])
+        specs[f"{module}.alpha"] = (dtype, ())
+
+    metadata = {"ss_merged_from": json.dumps([
+        {"model": os.path.basename(lora.path), "ratio": ratio} for lora, ratio in zip(loras, ratios)
+    ])}
+    network_module = loras[0].metadata.get("ss_network_module")
+    if network_module:
+        metadata["ss_network_module"] = network_module
+
+    writer = SafeTensorsWriter(save_to, specs, metadata)
+    try:
+        for position, (module, entry) in enumerate(modules.items(), start=1):
+            down, up, alpha = merge_module(loras, ratios, entry, concat)
+            if shuffle:
+                permutation = rng.permutation(down.shape[0])
+                down = down[permutation]
+                up = up[:, permutation]
+            writer.write(f"{module}.lora_down.weight", down)
+            writer.write(f"{module}.lora_up.weight", up)
+            writer.write(f"{module}.alpha", np.array(alpha, dtype=np.float32))
+            if log and (position % 50 == 0 or position == len(modules)):
+                log(f"\rMerged {position}/{len(modules)} modules", end="", flush=True)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+    if log:
+        log("")
+        if skipped:
+            log(f"Skipped {len(skipped)} keys that are not LoRA down/up/alpha tensors.")
+    return {
+        "save_to": save_to,
+        "modules": len(modules),
+        "skipped": skipped,
+        "seconds": time.time() - start_time,
+    }
+
+def merge_loras(models, ratios, save_to, save_precision="fp16", concat=False, shuffle=False, seed=None, log=print):
+    """
+    Merges LoRA files into 'save_to' without loading any of them fully: the inputs are
+    memory-mapped and read one module at a time. Returns a summary of the merge.
+    """
+    loras = [SafeTensorsFile(path) for path in models]
+    try:
+        return merge_opened(loras, ratios, save_to, save_precision, concat, shuffle, seed, log)
+    finally:
+        for lora in loras:
+            lora.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge LoRA files in-process, one module at a time.")
+    parser.add_argument("--save_to", required=True, help="Output .safetensors file")
+    parser.add_argument("--models", nargs="+", required=True, help="LoRA files to merge")
+    parser.add_argument("--ratios", nargs="+", type=float, required=True, help="One ratio per model")
+    parser.add_argument("--save_precision", default="fp16", help="fp16, bf16 or fp32")
+    parser.add_argument("--concat", action="store_true", help="Stack ranks instead of summing, exact for any ranks")
+    parser.add_argument("--shuffle", action="store_true", help="Shuffle the rank dimension of merged modules")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for --shuffle")
+    args = parser.parse_args()
+
+    try:
+        summary = merge_loras(args.models, args.ratios, args.save_to, args.save_precision,
+                              concat=args.concat, shuffle=args.shuffle, seed=args.seed)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Saved {summary['save_to']} ({summary['modules']} modules) in {summary['seconds']:.1f}s")
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from lora_io import SafeTensorsFile, SafeTensorsWriter, lora_modules
+from lora_merge import read_alpha, save_dtype
+from lora_svd import low_rank_svd, factored_error, ordered_results, print_error_report
+
+def module_factors(lora, parts):
+    """
+    Returns one module's (up, down) as 2-D float64 matrices.
+    """
+    down = lora.get(parts["lora_down"], np.float64)
+    up = lora.get(parts["lora_up"], np.float64)
+    return up.reshape(up.shape[0], -1), down.reshape(down.shape[0], -1)
+
+def singular_values(up, down):
+    """
+    Singular values of up @ down, from QR of each factor and an SVD of the small core.
+    """
+    _, r_up = np.linalg.qr(up)
+    _, r_down = np.linalg.qr(down.T)
+    return np.linalg.svd(r_up @ r_down.T, compute_uv=False)
+
+def choose_rank(values, rank=None, energy=None):
+    """
+    Picks the new rank of a module: the smallest keeping 'energy' of the squared singular values,
+    capped at 'rank', or just 'rank'. Never more than the current rank, never less than 1.
+    """
+    new_rank = len(values)
+    if energy is not None:
+        kept = np.cumsum(values ** 2) / max(float(np.sum(values ** 2)), 1e-30)
+        new_rank = int(np.searchsorted(kept, min(energy, 1.0) - 1e-12)) + 1
+    if rank is not None:
+        new_rank = min(new_rank, rank)
+    return max(1, min(new_rank, len(values)))
+
+def resize_module(lora, parts, new_rank, seed):
+    """
+    Truncates one module to 'new_rank'. Returns (down, up, alpha, relative error).
+    Like kohya's resize_lora.py the singular values go on the up factor and alpha is rescaled
+    so alpha / rank, the module's scale, is unchanged.
+    """
+    up, down = module_factors(lora, parts)
+    rank = down.shape[0]
+    alpha = read_alpha(lora, None, parts)
+    down_shape = (new_rank,) + lora.shape(parts["lora_down"])[1:]
+    up_shape = (lora.shape(parts["lora_up"])[0], new_rank) + lora.shape(parts["lora_up"])[2:]
+    if new_rank >= rank:
+        return down.reshape(down_shape), up.reshape(up_shape), alpha, 0.0
+
+    u, s, vt = low_rank_svd(up, down, new_rank, np.random.default_rng(seed))
+    new_up = u * s
+    error = factored_error(up, down, new_up, vt)
+    return vt.reshape(down_shape), new_up.reshape(up_shape), alpha * new_rank / rank, error
+
+def resize_lora(lora_path, save_to, rank=None, energy=None, save_precision=None, workers=None,
+                report_path=None, log=print):
+    """
+    Reduces the rank of every module of a LoRA by truncated SVD of its delta, to 'rank', to the smallest
+    rank keeping 'energy' (0-1) of each module's squared singular values, or both (energy capped at rank).
+    Runs in two streaming passes over the memory-mapped input on a thread pool: the first measures
+    singular values to size the output, the second writes each module as it is truncated.
+    Returns a summary with the relative error and new rank of every module.
+    """
+    if rank is None and energy is None:
+        raise ValueError("Give a target rank, an energy threshold or both")
+    workers = workers or min(8, os.cpu_count() or 1)
+    start_time = time.time()
+
+    lora = SafeTensorsFile(lora_path)
+    try:
+        found, others = lora_modules(lora.keys())
+        modules = {m: p for m, p in found.items() if "lora_down" in p and "lora_up" in p}
+        if not modules:
+            raise ValueError(f"{lora_path} has no lora_down/lora_up pairs")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            values = dict(zip(modules, pool.map(lambda p: singular_values(*module_factors(lora, p)), modules.values())))
+        new_ranks = {m: choose_rank(values[m], rank, energy) for m in modules}
+
+        specs = {}
+        for module, parts in modules.items():
+            dtype = save_dtype(save_precision) if save_precision else lora.dtype(parts["lora_down"])
+            down_shape = lora.shape(parts["lora_down"])
+            up_shape = lora.shape(parts["lora_up"])
+            specs[f"{module}.lora_down.weight"] = (dtype, (new_ranks[module],) + down_shape[1:])
+            specs[f"{module}.lora_up.weight"] = (dtype, (up_shape[0], new_ranks[module]) + up_shape[2:])
+            specs[f"{module}.alpha"] = (dtype, ())
+
+        # Like kohya's resize_lora.py, the dim and alpha metadata become "Dynamic" when modules differ
+        new_alphas = {m: read_alpha(lora, None, p) * new_ranks[m] / lora.shape(p["lora_down"])[0] for m, p in modules.items()}
+        metadata = dict(lora.metadata)
+        metadata["ss_resized_from"] = os.path.basename(lora_path)
+        metadata["ss_network_dim"] = str(next(iter(new_ranks.values()))) if len(set(new_ranks.values())) == 1 else "Dynamic"
+        metadata["ss_network_alpha"] = f"{next(iter(new_alphas.values())):g}" if len(set(new_alphas.values())) == 1 else "Dynamic"
+
+        def work(item):
+            position, (module, parts) = item
+            return module, resize_module(lora, parts, new_ranks[module], position)
+
+        errors = {}
+        writer = SafeTensorsWriter(save_to, specs, metadata)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = ordered_results(pool, work, enumerate(modules.items()), workers * 2)
+                for position, (module, (down, up, alpha, error)) in enumerate(results, start=1):
+                    writer.write(f"{module}.lora_down.weight", down)
+                    writer.write(f"{module}.lora_up.weight", up)
+                    writer.write(f"{module}.alpha", np.array(alpha, dtype=np.float32))
+                    errors[module] = round(error, 6)
+                    if log and (position % 50 == 0 or position == len(modules)):
+                        log(f"\rResized {position}/{len(modules)} modules", end="", flush=True)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+    finally:
+        lora.close()
+
+    ranks = sorted(set(new_ranks.values()))
+    summary = {
+        "save_to": save_to,
+        "rank": str(ranks[0]) if len(ranks) == 1 else f"{ranks[0]}-{ranks[-1]}",
+        "modules": len(modules),
+        "mean_error": float(np.mean(list(errors.values()))),
+        "max_error": max(errors.values()),
+        "errors": errors,
+        "new_ranks": new_ranks,
+        "skipped": others,
+        "size_before": os.path.getsize(lora_path),
+        "size_after": os.path.getsize(save_to),
+        "seconds": time.time() - start_time,
+    }
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+    if log:
+        log("")
+        if others:
+            log(f"Dropped {len(others)} keys that are not LoRA down/up/alpha tensors.")
+        log(f"Size {summary['size_before'] / 1024 ** 2:.1f} MB -> {summary['size_after'] / 1024 ** 2:.1f} MB")
+        print_error_report(summary, log)
+    return summary
+
+def run_resize_menu():
+    """
+    Prompts for a LoRA to resize and runs the resize.
+    """
+    lora_path = input("Enter the path to the LoRA file to resize: ").strip()
+    if not os.path.exists(lora_path):
+        print(f"Error: The file '{lora_path}' does not exist.")
+        return
+    try:
+        rank_text = input("Enter the new rank (leave blank to use only an energy threshold): ").strip()
+        energy_text = input("Enter the energy to keep, e.g. 0.95 (leave blank for a fixed rank): ").strip()
+        rank = int(rank_text) if rank_text else None
+        energy = float(energy_text) if energy_text else None
+    except ValueError:
+        print("Please enter a valid number.")
+        return
+    save_to = input("Enter the path to save the resized LoRA file (e.g., H:\\resized.safetensors): ").strip()
+    report_path = os.path.splitext(save_to)[0] + "_resize_report.json"
+    try:
+        summary = resize_lora(lora_path, save_to, rank, energy, report_path=report_path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return
+    print(f"Resize completed in {summary['seconds']:.1f}s, per-layer errors saved to {report_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reduce the rank of a LoRA with truncated SVD.")
+    parser.add_argument("lora", help="LoRA file to resize")
+    parser.add_argument("save_to", help="Output .safetensors file")
+    parser.add_argument("--new_rank", type=int, default=None, help="Target rank (the cap when --energy is given)")
+    parser.add_argument("--energy", type=float, default=None, help="Keep this fraction (0-1) of each layer's energy")
+    parser.add_argument("--save_precision", default=None, help="fp16, bf16 or fp32 (default: same as the input)")
+    parser.add_argument("--workers", type=int, default=None, help="Threads working on modules")
+    parser.add_argument("--report", default=None, help="Write the per-module error report to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        resize_lora(args.lora, args.save_to, args.new_rank, args.energy, args.save_precision, args.workers, args.report)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,266 @@
+import argparse
+import os
+import random
+import sys
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from lora_io import SafeTensorsFile, lora_modules
+from lora_index import update_index, merge_group
+from lora_merge import read_alpha
+
+fingerprint_name = ".lora_fingerprints.npz"
+# Each module's delta is sketched to sketch_size x sketch_size, and the sketches of all modules
+# are projected together into one fingerprint_dim vector per LoRA
+sketch_size = 4
+fingerprint_dim = 256
+projection_seed = 1234
+# Default cosine similarities above which LoRAs count as duplicates, or as too alike to blend
+default_duplicate_threshold = 0.95
+default_max_similarity = 0.5
+
+@lru_cache(maxsize=None)
+def side_projection(size):
+    """
+    Fixed random (size, sketch_size) matrix for one feature width, the same for every LoRA.
+    """
+    rng = np.random.default_rng([projection_seed, size])
+    return rng.standard_normal((size, sketch_size), dtype=np.float32) / np.float32(np.sqrt(sketch_size))
+
+@lru_cache(maxsize=8192)
+def module_projection(module):
+    """
+    Fixed random matrix taking one module's sketch into the fingerprint, chosen by the module name
+    so the same module lands in the same place for every LoRA.
+    """
+    rng = np.random.default_rng([projection_seed, zlib.crc32(module.encode("utf-8"))])
+    return rng.standard_normal((sketch_size * sketch_size, fingerprint_dim), dtype=np.float32) / np.float32(np.sqrt(fingerprint_dim))
+
+def fingerprint_lora(path):
+    """
+    Fingerprints a LoRA's weights: each module's delta scale * up @ down is sketched as
+    P_out.T @ up @ (down @ P_in) with fixed random projections, never forming the delta,
+    and the sketches are summed into a fingerprint_dim vector, a random projection of all the
+    deltas together. Cosine similarity of two fingerprints approximates that of the full deltas.
+    Returns (fingerprint, delta Frobenius norm), the norm computed exactly from Gram matrices.
+    """
+    fingerprint = np.zeros(fingerprint_dim, dtype=np.float32)
+    squared_norm = 0.0
+    with SafeTensorsFile(path) as lora:
+        found, _ = lora_modules(lora.keys())
+        for module, parts in sorted(found.items()):
+            if "lora_down" not in parts or "lora_up" not in parts:
+                continue
+            down = lora.get(parts["lora_down"])
+            up = lora.get(parts["lora_up"])
+            down = down.reshape(down.shape[0], -1)
+            up = up.reshape(up.shape[0], -1)
+            scale = read_alpha(lora, module, parts) / down.shape[0]
+            sketch = (side_projection(up.shape[0]).T @ up) @ (down @ side_projection(down.shape[1]))
+            fingerprint += scale * (sketch.reshape(-1) @ module_projection(module))
+            squared_norm += scale * scale * float(np.sum((up.T @ up) * (down @ down.T).T))
+    return fingerprint, float(np.sqrt(max(squared_norm, 0.0)))
+
+def load_fingerprints(folder_path):
+    """
+    Reads the stored fingerprints of a folder as {file name: (signature, family, fingerprint, norm)}.
+    Fingerprints made with other settings are discarded.
+    """
+    try:
+        with np.load(os.path.join(folder_path, fingerprint_name)) as data:
+            if data["settings"].tolist() != [sketch_size, fingerprint_dim, projection_seed]:
+                return {}
+            return {str(name): (signature.tolist(), str(family), vector, float(norm)) for name, signature, family, vector, norm
+                    in zip(data["names"], data["signatures"], data["families"], data["vectors"], data["norms"])}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def save_fingerprints(folder_path, fingerprints):
+    names = sorted(fingerprints)
+    path = os.path.join(folder_path, fingerprint_name)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(
+            f,
+            settings=np.array([sketch_size, fingerprint_dim, projection_seed]),
+            names=np.array(names, dtype=str),
+            signatures=np.array([fingerprints[n][0] for n in names], dtype=np.int64).reshape(-1, 2),
+            families=np.array([fingerprints[n][1] for n in names], dtype=str),
+            vectors=np.array([fingerprints[n][2] for n in names], dtype=np.float32).reshape(-1, fingerprint_dim),
+            norms=np.array([fingerprints[n][3] for n in names], dtype=np.float32),
+        )
+    os.replace(path + ".tmp", path)
+
+def update_fingerprints(folder_path, index=None, workers=8):
+    """
+    Brings the fingerprints of the LoRAs in 'folder_path' up to date, stored next to the LoRA index
+    in .lora_fingerprints.npz. Like the index, only new files and files whose size or mtime changed
+    are read, on a thread pool since NumPy does the work outside the GIL.
+    Returns {file name: (signature, family, fingerprint, norm)}.
+    """
+    index = index if index is not None else update_index(folder_path)
+    previous = load_fingerprints(folder_path)
+    fingerprints = {}
+    stale = []
+    for name, entry in index.items():
+        if "error" in entry:
+            continue
+        known = previous.get(name)
+        if known and known[0] == entry["signature"]:
+            fingerprints[name] = known
+        else:
+            stale.append((name, entry))
+
+    def read(item):
+        name, entry = item
+        try:
+            vector, norm = fingerprint_lora(os.path.join(folder_path, name))
+        except (OSError, ValueError):
+            return name, None
+        return name, (entry["signature"], entry.get("family", "unknown"), vector, norm)
+
+    if stale:
+        print(f"Fingerprinting {len(stale)} new or changed LoRAs...")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for done, (name, fingerprint) in enumerate(pool.map(read, stale), start=1):
+                if fingerprint is not None:
+                    fingerprints[name] = fingerprint
+                if done % 25 == 0 or done == len(stale):
+                    print(f"\r{done}/{len(stale)} fingerprinted", end="", flush=True)
+        print()
+    if fingerprints.keys() != previous.keys() or stale:
+        save_fingerprints(folder_path, fingerprints)
+    return fingerprints
+
+def fingerprint_matrix(fingerprints, names):
+    """
+    Unit-length fingerprints of 'names' as rows of a matrix, with their families.
+    Files without a fingerprint get a zero row, similar to nothing.
+    """
+    vectors = np.zeros((len(names), fingerprint_dim), dtype=np.float32)
+    families = []
+    for row, name in enumerate(names):
+        if name in fingerprints:
+            vectors[row] = fingerprints[name][2]
+        families.append(fingerprints[name][1] if name in fingerprints else None)
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, lengths, out=vectors, where=lengths > 0)
+    return vectors, np.array(families, dtype=object)
+
+def similarities(vectors, families, rows):
+    """
+    Cosine similarity of the fingerprints at 'rows' to every fingerprint. Fingerprints of different
+    families come from different modules and are never compared, their similarity is 0.
+    """
+    result = vectors[rows] @ vectors.T
+    result[families[rows][:, None] != families[None, :]] = 0.0
+    return result
+
+def nearest(fingerprints, name, count=10):
+    """
+    Returns the 'count' LoRAs most similar to 'name' as [(file name, cosine similarity)].
+    """
+    names = sorted(fingerprints)
+    vectors, families = fingerprint_matrix(fingerprints, names)
+    row = names.index(name)
+    scores = similarities(vectors, families, [row])[0]
+    order = [i for i in np.argsort(-scores) if i != row and families[i] == families[row]]
+    return [(names[i], float(scores[i])) for i in order[:count]]
+
+def find_duplicates(fingerprints, threshold=default_duplicate_threshold, block=1024):
+    """
+    Groups LoRAs whose fingerprints have a cosine similarity of at least 'threshold' with another
+    member of the group. Similarities are computed a block of rows at a time so thousands of
+    files never need the full matrix. Returns the groups of two or more file names.
+    """
+    names = sorted(fingerprints)
+    vectors, families = fingerprint_matrix(fingerprints, names)
+    parent = list(range(len(names)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for start in range(0, len(names), block):
+        rows = np.arange(start, min(start + block, len(names)))
+        for i, j in zip(*np.nonzero(similarities(vectors, families, rows) >= threshold)):
+            i += start
+            if i < j:
+                parent[root(i)] = root(j)
+
+    groups = {}
+    for i, name in enumerate(names):
+        groups.setdefault(root(i), []).append(name)
+    return sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+def diverse_sample(fingerprints, names, count, max_similarity=default_max_similarity, rng=random, groups=None):
+    """
+    Picks 'count' of 'names' at random, avoiding near-duplicates: the first pick is uniform among the
+    fingerprinted files of groups with at least 'count' of them, and only files of its group can
+    follow. 'groups' maps names to a group such as lora_index.merge_group's (family, rank), names
+    mapped to None are never picked; by default files are grouped by family, since merging
+    architectures only gives the union of their keys. Each later pick is drawn from the files whose
+    similarity to every pick so far is at most 'max_similarity' (by absolute cosine, since a LoRA and
+    its negation cancel out), or is the least similar file when none qualify.
+    Returns None when no group has 'count' fingerprinted files.
+    """
+    names = list(names)
+    vectors, families = fingerprint_matrix(fingerprints, names)
+    if groups is None:
+        keys = list(families)
+    else:
+        keys = [groups.get(name) if name in fingerprints else None for name in names]
+    sizes = Counter(key for key in keys if key is not None)
+    eligible = [i for i, key in enumerate(keys) if key is not None and sizes[key] >= count]
+    if not eligible:
+        return None
+    picked = [eligible[rng.randrange(len(eligible))]]
+    closest = np.abs(similarities(vectors, families, picked)[0])
+    closest[np.array([key != keys[picked[0]] for key in keys])] = np.inf
+    closest[picked] = np.inf
+    while len(picked) < count:
+        allowed = np.flatnonzero(closest <= max_similarity)
+        choice = int(allowed[rng.randrange(len(allowed))]) if len(allowed) else int(np.argmin(closest))
+        picked.append(choice)
+        closest = np.maximum(closest, np.abs(similarities(vectors, families, [choice])[0]))
+        closest[picked] = np.inf
+    return [names[i] for i in picked]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint the LoRAs of a folder by their weights and compare them.")
+    parser.add_argument("folder", help="Folder of LoRAs, fingerprints are kept in it next to the LoRA index")
+    parser.add_argument("--nearest", default=None, help="List the LoRAs most similar to this file name")
+    parser.add_argument("--count", type=int, default=10, help="Results for --nearest, files for --sample")
+    parser.add_argument("--dedupe", type=float, nargs="?", const=default_duplicate_threshold, default=None,
+                        help=f"List groups of near-duplicates above this similarity (default {default_duplicate_threshold})")
+    parser.add_argument("--sample", action="store_true", help="Draw --count dissimilar LoRAs of one family and rank")
+    parser.add_argument("--max_similarity", type=float, default=default_max_similarity, help="Similarity limit for --sample")
+    parser.add_argument("--workers", type=int, default=8, help="Threads used for fingerprinting")
+    args = parser.parse_args()
+
+    index = update_index(args.folder)
+    fingerprints = update_fingerprints(args.folder, index, workers=args.workers)
+    print(f"{len(fingerprints)} LoRAs fingerprinted in {args.folder}")
+    if args.nearest:
+        if args.nearest not in fingerprints:
+            print(f"Error: {args.nearest} has no fingerprint")
+            sys.exit(1)
+        for name, score in nearest(fingerprints, args.nearest, args.count):
+            print(f"  {score:>6.3f}  {name}")
+    if args.dedupe is not None:
+        groups = find_duplicates(fingerprints, args.dedupe)
+        for group in groups:
+            norms = {name: fingerprints[name][3] for name in group}
+            print("\n" + "\n".join(f"  {name}  (norm {norms[name]:.3g})" for name in group))
+        print(f"\n{len(groups)} groups of near-duplicates, {sum(len(g) - 1 for g in groups)} redundant files.")
+    if args.sample:
+        groups = {name: merge_group(entry) for name, entry in index.items()}
+        picked = diverse_sample(fingerprints, sorted(fingerprints), args.count, args.max_similarity, groups=groups)
+        if picked is None:
+            print(f"Error: No family and rank has {args.count} fingerprinted LoRAs.")
+            sys.exit(1)
+        for name in picked:
+            print(f"  {name}")
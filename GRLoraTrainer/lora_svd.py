@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from lora_io import SafeTensorsFile, SafeTensorsWriter
+from lora_merge import plan_merge, save_dtype
+
+# kohya's svd_merge_lora.py clamps the factors to this quantile of their absolute values
+default_clamp_quantile = 0.99
+# Extra columns and power iterations for the randomized range finder
+oversample = 10
+power_iterations = 2
+
+def stacked_factors(loras, ratios, entry):
+    """
+    Returns (up, down) whose product is the ratio-weighted sum of the inputs' deltas for one module,
+    as float64 matrices of shape (out, R) and (R, in) where R is the sum of the input ranks.
+    Conv weights are flattened to 2-D.
+    """
+    ups, downs = [], []
+    for index, rank, alpha, parts in entry["sources"]:
+        lora = loras[index]
+        down = lora.get(parts["lora_down"], np.float64)
+        up = lora.get(parts["lora_up"], np.float64)
+        ups.append(up.reshape(up.shape[0], -1) * (ratios[index] * alpha / rank))
+        downs.append(down.reshape(down.shape[0], -1))
+    return np.concatenate(ups, axis=1), np.concatenate(downs, axis=0)
+
+def low_rank_svd(up, down, rank, rng):
+    """
+    Truncated SVD of up @ down without forming the product. Returns (U, S, Vt) with 'rank' columns.
+    When the stacked rank is close to 'rank' the SVD is exact, through QR of each factor and an SVD
+    of the small R x R core. Otherwise a randomized range finder with power iterations is used.
+    """
+    stacked = up.shape[1]
+    if stacked <= 4 * (rank + oversample):
+        q_up, r_up = np.linalg.qr(up)
+        q_down, r_down = np.linalg.qr(down.T)
+        u, s, vt = np.linalg.svd(r_up @ r_down.T)
+        return q_up @ u[:, :rank], s[:rank], vt[:rank] @ q_down.T
+
+    omega = rng.standard_normal((down.shape[1], rank + oversample))
+    y = up @ (down @ omega)
+    for _ in range(power_iterations):
+        y, _ = np.linalg.qr(y)
+        z, _ = np.linalg.qr(down.T @ (up.T @ y))
+        y = up @ (down @ z)
+    q, _ = np.linalg.qr(y)
+    u, s, vt = np.linalg.svd((q.T @ up) @ down, full_matrices=False)
+    return q @ u[:, :rank], s[:rank], vt[:rank]
+
+def factored_error(up, down, new_up, new_down):
+    """
+    Relative Frobenius error ||up @ down - new_up @ new_down|| / ||up @ down||, computed from
+    small Gram matrices so the full delta is never formed.
+    """
+    original = np.sum((up.T @ up) * (down @ down.T).T)
+    approx = np.sum((new_up.T @ new_up) * (new_down @ new_down.T).T)
+    cross = np.sum((up.T @ new_up) * (down @ new_down.T))
+    residual = max(original + approx - 2 * cross, 0.0)
+    return float(np.sqrt(residual / original)) if original > 0 else 0.0
+
+def svd_merge_module(loras, ratios, entry, rank, clamp_quantile, seed):
+    """
+    Merges one module to 'rank' and returns (down, up, alpha, relative error).
+    Like svd_merge_lora.py the singular values go on the up factor and alpha equals the new rank.
+    """
+    up, down = stacked_factors(loras, ratios, entry)
+    new_rank = min(rank, up.shape[1], up.shape[0], down.shape[1])
+    u, s, vt = low_rank_svd(up, down, new_rank, np.random.default_rng(seed))
+    new_up = u * s
+    new_down = vt
+    if clamp_quantile:
+        limit = np.quantile(np.abs(np.concatenate([new_up.ravel(), new_down.ravel()])), clamp_quantile)
+        new_up = np.clip(new_up, -limit, limit)
+        new_down = np.clip(new_down, -limit, limit)
+    error = factored_error(up, down, new_up, new_down)
+
+    down_shape = (new_rank,) + entry["down_shape"][1:]
+    up_shape = (entry["up_shape"][0], new_rank) + entry["up_shape"][2:]
+    return new_down.reshape(down_shape), new_up.reshape(up_shape), float(new_rank), error
+
+def ordered_results(pool, function, items, ahead):
+    """
+    Yields function(item) in order, keeping at most 'ahead' results computed ahead of the consumer.
+    """
+    items = iter(items)
+    pending = []
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= ahead:
+            break
+    while pending:
+        result = pending.pop(0).result()
+        for item in items:
+            pending.append(pool.submit(function, item))
+            break
+        yield result
+
+def svd_merge_loras(models, ratios, save_to, rank=4, save_precision="fp16", workers=None,
+                    clamp_quantile=default_clamp_quantile, seed=0, report_path=None, log=print):
+    """
+    Merges LoRA files into one LoRA of 'rank' by truncated SVD of each module's combined delta.
+    Modules are processed on a thread pool (numpy releases the GIL in its linear algebra) and
+    written in order as they finish. Returns a summary with the relative reconstruction error
+    of every module, also saved as JSON to 'report_path' when given.
+    """
+    if len(models) != len(ratios):
+        raise ValueError("Each model needs a ratio")
+    dtype = save_dtype(save_precision)
+    workers = workers or min(8, os.cpu_count() or 1)
+    start_time = time.time()
+
+    loras = [SafeTensorsFile(path) for path in models]
+    try:
+        modules, skipped = plan_merge(loras, concat=True)
+        specs = {}
+        for module, entry in modules.items():
+            new_rank = min(rank, entry["down_shape"][0], entry["up_shape"][0],
+                           int(np.prod(entry["down_shape"][1:])))
+            specs[f"{module}.lora_down.weight"] = (dtype, (new_rank,) + entry["down_shape"][1:])
+            specs[f"{module}.lora_up.weight"] = (dtype, (entry["up_shape"][0], new_rank) + entry["up_shape"][2:])
+            specs[f"{module}.alpha"] = (dtype, ())
+
+        metadata = {"ss_merged_from": json.dumps([
+            {"model": os.path.basename(path), "ratio": ratio} for path, ratio in zip(models, ratios)
+        ]), "ss_network_dim": str(rank), "ss_network_alpha": str(rank)}
+        network_module = loras[0].metadata.get("ss_network_module")
+        if network_module:
+            metadata["ss_network_module"] = network_module
+
+        def work(item):
+            position, (module, entry) = item
+            return module, svd_merge_module(loras, ratios, entry, rank, clamp_quantile, seed + position)
+
+        errors = {}
+        writer = SafeTensorsWriter(save_to, specs, metadata)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = ordered_results(pool, work, enumerate(modules.items()), workers * 2)
+                for position, (module, (down, up, alpha, error)) in enumerate(results, start=1):
+                    writer.write(f"{module}.lora_down.weight", down)
+                    writer.write(f"{module}.lora_up.weight", up)
+                    writer.write(f"{module}.alpha", np.array(alpha, dtype=np.float32))
+                    errors[module] = round(error, 6)
+                    if log and (position % 50 == 0 or position == len(modules)):
+                        log(f"\rMerged {position}/{len(modules)} modules", end="", flush=True)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+    finally:
+        for lora in loras:
+            lora.close()
+
+    summary = {
+        "save_to": save_to,
+        "rank": rank,
+        "modules": len(modules),
+        "mean_error": float(np.mean(list(errors.values()))) if errors else 0.0,
+        "max_error": max(errors.values()) if errors else 0.0,
+        "errors": errors,
+        "skipped": skipped,
+        "seconds": time.time() - start_time,
+    }
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+    if log:
+        log("")
+        print_error_report(summary, log)
+    return summary
+
+def print_error_report(summary, log=print, worst=10):
+    """
+    Prints the mean and maximum reconstruction error and the modules that lost the most.
+    """
+    log(f"Reconstruction error at rank {summary['rank']}: mean {summary['mean_error']:.2%}, "
+        f"max {summary['max_error']:.2%} (relative Frobenius norm per module)")
+    ranked = sorted(summary["errors"].items(), key=lambda item: item[1], reverse=True)[:worst]
+    for module, error in ranked:
+        log(f"  {error:>7.2%}  {module}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge LoRA files to a target rank with truncated SVD.")
+    parser.add_argument("--save_to", required=True, help="Output .safetensors file")
+    parser.add_argument("--models", nargs="+", required=True, help="LoRA files to merge")
+    parser.add_argument("--ratios", nargs="+", type=float, required=True, help="One ratio per model")
+    parser.add_argument("--new_rank", type=int, default=4, help="Rank of the merged LoRA")
+    parser.add_argument("--save_precision", default="fp16", help="fp16, bf16 or fp32")
+    parser.add_argument("--workers", type=int, default=None, help="Threads working on modules")
+    parser.add_argument("--no_clamp", action="store_true", help="Do not clamp outliers like svd_merge_lora.py")
+    parser.add_argument("--report", default=None, help="Write the per-module error report to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        svd_merge_loras(args.models, args.ratios, args.save_to, args.new_rank, args.save_precision, args.workers,
+                        None if args.no_clamp else default_clamp_quantile, report_path=args.report)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
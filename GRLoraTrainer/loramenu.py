@@ -17,6 +17,13 @@ def run_caption():
         return
 
     folder_path = input("Enter the folder path containing images to caption: ").strip()
+    from caption_server import is_server_running
+    if is_server_running():
+        # Caption in this process, which hands the images to the server, instead of starting another Python
+        from caption import caption_images_in_folder
+        print("Sending the folder to the captioning server...")
+        caption_images_in_folder(folder_path)
+        return
     print("Running caption.py...")
     subprocess.run(["python", caption_script, folder_path])
 
@@ -38,6 +45,36 @@ def run_merge_lora():
     print("Running mergelora.py...")
     subprocess.run(["python", merge_lora_script])
 
+def run_training_queue():
+    from train_queue import queue_menu
+    queue_menu()
+
+def run_start_caption_server():
+    caption_server_script = "caption_server.py"
+    if not os.path.exists(caption_server_script):
+        print(f"Error: The script '{caption_server_script}' does not exist.")
+        return
+
+    from caption_server import is_server_running
+    if is_server_running():
+        print("The captioning server is already running.")
+        return
+
+    preload = input("Enter the models to keep loaded (base, large or both) (default: base): ").strip().lower()
+    models = ["base", "large"] if preload == "both" else [preload or "base"]
+
+    # Run the server in its own console so it outlives this menu and keeps the models warm
+    print("Starting caption_server.py...")
+    subprocess.Popen(["python", caption_server_script, "--preload", *models],
+                     creationflags=getattr(subprocess, "CREATE_NEW_CONSOLE", 0))
+
+def run_stop_caption_server():
+    from caption_server import stop_server
+    if stop_server():
+        print("Captioning server stopped.")
+    else:
+        print("No captioning server is running.")
+
 def main_menu():
     while True:
         print("\nMain Menu")
@@ -45,7 +82,10 @@ def main_menu():
         print("2. Train LoRA (Flux1 Training)")
         print("3. Resume LoRA Training")
         print("4. Merge LoRA Models")
-        print("5. Exit")
+        print("5. Training Queue")
+        print("6. Start Captioning Server")
+        print("7. Stop Captioning Server")
+        print("8. Exit")
 
         choice = input("Enter your choice: ").strip()
 
@@ -58,6 +98,12 @@ def main_menu():
         elif choice == "4":
             run_merge_lora()
         elif choice == "5":
+            run_training_queue()
+        elif choice == "6":
+            run_start_caption_server()
+        elif choice == "7":
+            run_stop_caption_server()
+        elif choice == "8":
             print("Exiting the program.")
             break
         else:
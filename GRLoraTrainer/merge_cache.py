@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from file_utils import hash_file, link_or_copy
+
+# Merged LoRAs are kept outside the output folders so any later identical merge can reuse them
+default_cache_dir = Path.home() / ".grloratrainer" / "merge_cache"
+# Least recently used merges are evicted once the cache holds more than this
+default_max_bytes = 20 * 1024 ** 3
+
+class MergeCache:
+    """
+    Store of merge outputs keyed by a fingerprint of the merge request: the inputs' content hashes,
+    ratios, method, save precision and flags. An identical request is answered by hard-linking
+    (or copying across drives) the stored file instead of merging again.
+    Input hashes are remembered by path, size and mtime so fingerprinting does not re-read the LoRAs.
+    """
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=default_max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(str(self.cache_dir / "merge_cache.db"), timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS merges ("
+            "fingerprint TEXT PRIMARY KEY, size INTEGER NOT NULL, description TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def file_hash(self, path):
+        """
+        Returns the content hash of 'path', only reading the file if it changed since it was last hashed.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime_ns, hash FROM file_hashes WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = hash_file(path)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                              (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def fingerprint(self, models, ratios, method, precision, **flags):
+        """
+        Fingerprints a merge request. Inputs are sorted by content hash, so renamed or reordered
+        copies of the same request match. kohya's summing merge keeps the first model's alpha,
+        so for that method the first input is fingerprinted as well.
+        """
+        hashes = [self.file_hash(path) for path in models]
+        request = {
+            "inputs": sorted([digest, float(ratio)] for digest, ratio in zip(hashes, ratios)),
+            "method": method,
+            "precision": precision.strip().lower(),
+            "flags": flags,
+        }
+        if method == "flux" and not flags.get("concat"):
+            request["first"] = hashes[0]
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path_for(self, fingerprint):
+        return self.cache_dir / f"{fingerprint}.safetensors"
+
+    def fetch(self, fingerprint, save_to):
+        """
+        Places the stored result for 'fingerprint' at 'save_to'. Returns False if there is none.
+        """
+        stored = self.path_for(fingerprint)
+        row = self.conn.execute("SELECT 1 FROM merges WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is None or not stored.exists():
+            return False
+        if os.path.abspath(save_to) != os.path.abspath(stored):
+            if os.path.exists(save_to):
+                os.remove(save_to)
+            link_or_copy(stored, save_to)
+        with self.conn:
+            self.conn.execute("UPDATE merges SET last_used = ? WHERE fingerprint = ?", (time.time(), fingerprint))
+        return True
+
+    def store(self, fingerprint, save_to, description=""):
+        """
+        Adds a finished merge output to the cache, then evicts old entries over the size cap.
+        """
+        stored = self.path_for(fingerprint)
+        if not stored.exists():
+            tmp_path = stored.with_name(stored.name + ".tmp")
+            if tmp_path.exists():
+                os.remove(tmp_path)
+            link_or_copy(save_to, tmp_path)
+            os.replace(tmp_path, stored)
+        now = time.time()
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO merges VALUES (?, ?, ?, ?, ?)",
+                              (fingerprint, stored.stat().st_size, description, now, now))
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used merges until the cache fits in max_bytes. Returns the number removed.
+        """
+        rows = self.conn.execute("SELECT fingerprint, size FROM merges ORDER BY last_used DESC").fetchall()
+        total = 0
+        removed = []
+        for fingerprint, size in rows:
+            stored = self.path_for(fingerprint)
+            if not stored.exists():
+                removed.append(fingerprint)
+                continue
+            total += size
+            if total > self.max_bytes:
+                os.remove(stored)
+                removed.append(fingerprint)
+        if removed:
+            with self.conn:
+                self.conn.executemany("DELETE FROM merges WHERE fingerprint = ?", [(f,) for f in removed])
+        return len(removed)
+
+    def close(self):
+        self.conn.close()
+
+def cached_merge(models, ratios, save_to, method, precision, merge, **flags):
+    """
+    Runs 'merge()' to produce 'save_to' unless an identical merge is cached.
+    Returns (merge summary or None, True if the result came from the cache).
+    """
+    cache = MergeCache()
+    try:
+        fingerprint = cache.fingerprint(models, ratios, method, precision, **flags)
+        if cache.fetch(fingerprint, save_to):
+            return None, True
+        summary = merge()
+        description = json.dumps({"models": [os.path.basename(m) for m in models], "ratios": ratios,
+                                  "method": method, "precision": precision, "flags": flags})
+        cache.store(fingerprint, save_to, description)
+        return summary, False
+    finally:
+        cache.close()
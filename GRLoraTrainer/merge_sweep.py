@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from lora_index import update_index, merge_group
+from lora_io import SafeTensorsFile
+from lora_merge import merge_opened
+
+manifest_name = "sweep_manifest.json"
+
+def random_weights(count, rng=random):
+    """
+    Generates 'count' random weights summing to 1.0, rounded to two decimal places.
+    """
+    weights = [rng.random() for _ in range(count)]
+    total_weight = sum(weights)
+    normalized_weights = [round(w / total_weight, 2) for w in weights]
+
+    # Adjust the last weight to ensure the sum equals exactly 1.0
+    normalized_weights[-1] = round(1.0 - sum(normalized_weights[:-1]), 2)
+    return normalized_weights
+
+def sample_blends(files, count, outputs, seed):
+    """
+    Draws every blend of the sweep up front: 'outputs' random sets of 'count' files with random weights.
+    The same files, count, outputs and seed always give the same blends. A set of files is not repeated
+    while unused combinations remain likely to be found.
+    """
+    rng = random.Random(seed)
+    blends = []
+    seen = set()
+    for _ in range(outputs):
+        for _attempt in range(100):
+            selected = rng.sample(files, count)
+            if frozenset(selected) not in seen:
+                break
+        seen.add(frozenset(selected))
+        blends.append((selected, random_weights(count, rng)))
+    return blends
+
+# Sources opened by this worker process, each file is mapped once and reused by every blend it appears in
+opened_sources = {}
+
+def merge_blend(job):
+    """
+    Pool worker: merges one blend from already opened sources.
+    """
+    loras = []
+    for path in job["sources"]:
+        if path not in opened_sources:
+            opened_sources[path] = SafeTensorsFile(path)
+        loras.append(opened_sources[path])
+    summary = merge_opened(loras, job["ratios"], job["save_to"], job["precision"],
+                           shuffle=job["shuffle"], seed=job["seed"], log=None)
+    return summary["seconds"]
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, manifest_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, manifest_name)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def run_sweep(folder_path, count, outputs, output_dir, seed=None, precision="fp16", shuffle=True, workers=None,
+              family=None, rank=None):
+    """
+    Produces 'outputs' random merges of 'count' LoRAs each from 'folder_path' into 'output_dir',
+    on a process pool, and records each output's sources and ratios in sweep_manifest.json.
+    Only LoRAs of one architecture 'family' and one 'rank' are drawn, by default the folder's most
+    common ones, since merging different architectures only gives the union of their keys and
+    LoRAs of different ranks cannot be summed.
+    Re-running the same sweep skips outputs that were already written.
+    Returns the manifest.
+    """
+    index = update_index(folder_path)
+    families = Counter(entry["family"] for entry in index.values() if "error" not in entry)
+    if family is None and families:
+        family = families.most_common(1)[0][0]
+        if len(families) > 1:
+            print(f"Drawing only {family} LoRAs, the folder also has {', '.join(f for f in families if f != family)}.")
+    ranks = Counter(group[1] for group in map(merge_group, index.values()) if group and group[0] == family)
+    if rank is None and ranks:
+        rank = ranks.most_common(1)[0][0]
+        if len(ranks) > 1:
+            print(f"Drawing only rank {rank} LoRAs, the folder also has ranks {', '.join(str(r) for r in sorted(ranks) if r != rank)}.")
+    files = sorted(os.path.join(folder_path, name) for name, entry in index.items()
+                   if merge_group(entry) == (family, rank))
+    if len(files) < count:
+        print(f"Error: Only {len(files)} LoRAs of family {family} and rank {rank} available, but {count} required.")
+        return None
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    os.makedirs(output_dir, exist_ok=True)
+
+    settings = {"folder": os.path.abspath(folder_path), "count": count, "seed": seed,
+                "precision": precision, "shuffle": shuffle, "family": family, "rank": rank}
+    manifest = load_manifest(output_dir)
+    if not manifest or manifest.get("settings") != settings:
+        manifest = {"settings": settings, "outputs": {}}
+
+    jobs = []
+    for number, (sources, ratios) in enumerate(sample_blends(files, count, outputs, seed), start=1):
+        name = f"sweep_{seed}_{number:04d}.safetensors"
+        save_to = os.path.join(output_dir, name)
+        entry = manifest["outputs"].get(name)
+        if entry and entry.get("status") == "done" and os.path.exists(save_to):
+            continue
+        manifest["outputs"][name] = {
+            "sources": [os.path.basename(p) for p in sources], "ratios": ratios, "status": "pending",
+        }
+        jobs.append({"name": name, "save_to": save_to, "sources": sources, "ratios": ratios,
+                     "precision": precision, "shuffle": shuffle, "seed": seed + number})
+    save_manifest(output_dir, manifest)
+    if not jobs:
+        print("Every output of this sweep already exists.")
+        return manifest
+
+    distinct = len({path for job in jobs for path in job["sources"]})
+    workers = workers or min(4, os.cpu_count() or 1)
+    print(f"Merging {len(jobs)} blends from {distinct} distinct LoRAs with {workers} workers (seed {seed})...")
+    start_time = time.time()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(merge_blend, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            job = futures[future]
+            entry = manifest["outputs"][job["name"]]
+            try:
+                entry["seconds"] = round(future.result(), 2)
+                entry["status"] = "done"
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                failed += 1
+            save_manifest(output_dir, manifest)
+            print(f"\r{done}/{len(jobs)} merged, {failed} failed", end="", flush=True)
+
+    print(f"\nSweep finished in {time.time() - start_time:.1f}s, manifest: {os.path.join(output_dir, manifest_name)}")
+    return manifest
+
+def run_sweep_menu():
+    """
+    Prompts for a random-merge sweep and runs it.
+    """
+    folder_path = input("Enter the path to the folder containing LoRA models: ").strip()
+    if not os.path.exists(folder_path):
+        print(f"Error: The folder '{folder_path}' does not exist.")
+        return
+    try:
+        count = int(input("Enter the number of LoRAs per merge: ").strip())
+        outputs = int(input("Enter the number of merges to produce: ").strip())
+        seed_text = input("Enter a seed (leave blank for a random one): ").strip()
+        seed = int(seed_text) if seed_text else None
+    except ValueError:
+        print("Please enter a valid number.")
+        return
+    precision = input("Enter the save precision (fp16, bf16 or fp32): ").strip()
+    output_dir = input("Enter the folder to save the merges to: ").strip()
+    run_sweep(folder_path, count, outputs, output_dir, seed, precision)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Produce many random LoRA merges in one run.")
+    parser.add_argument("folder", help="Folder of LoRA files to draw from")
+    parser.add_argument("--count", type=int, required=True, help="LoRAs per merge")
+    parser.add_argument("--outputs", type=int, required=True, help="Number of merges to produce")
+    parser.add_argument("--output_dir", required=True, help="Folder for the merges and sweep_manifest.json")
+    parser.add_argument("--seed", type=int, default=None, help="Seed, the same seed reproduces the sweep")
+    parser.add_argument("--save_precision", default="fp16", help="fp16, bf16 or fp32")
+    parser.add_argument("--no_shuffle", action="store_true", help="Do not shuffle the rank dimension")
+    parser.add_argument("--workers", type=int, default=None, help="Merge processes (default: up to 4)")
+    parser.add_argument("--family", default=None, help="Architecture to draw, e.g. flux or zimage (default: the most common)")
+    parser.add_argument("--rank", type=int, default=None, help="Rank to draw (default: the most common in the family)")
+    args = parser.parse_args()
+    run_sweep(args.folder, args.count, args.outputs, args.output_dir, args.seed,
+              args.save_precision, not args.no_shuffle, args.workers, args.family, args.rank)
@@ -1,15 +1,33 @@
 import os
-import subprocess
 import random
+from collections import Counter
+from lora_merge import merge_loras
+from lora_svd import svd_merge_loras
+from merge_cache import cached_merge
+from lora_resize import run_resize_menu
+from lora_index import update_index, search_index, describe_line, merge_group
+from lora_similarity import update_fingerprints, diverse_sample
+from merge_sweep import random_weights, run_sweep_menu
+
+def filtered_models(folder_path):
+    """
+    Refreshes the folder's LoRA index and asks for an optional search.
+    Returns (matching file names, index).
+    """
+    index = update_index(folder_path)
+    families = sorted({entry.get("family") for entry in index.values() if "error" not in entry})
+    print(f"\n{len(index)} LoRAs indexed ({', '.join(families) or 'none readable'}).")
+    query = input("Filter by words, family:flux, family:zimage or rank:N (leave blank for all): ").strip()
+    return search_index(index, query), index
 
 def display_models_in_path(folder_path):
     """
-    Displays the models in the specified folder path in a paginated, two-column layout.
+    Displays the models in the specified folder path, filtered through the LoRA index,
+    in pages of 50 with their family, rank, dtype and size.
     """
-    files = [f for f in os.listdir(folder_path) if f.endswith('.safetensors')]
-    files.sort()
+    files, index = filtered_models(folder_path)
     if not files:
-        print("No `.safetensors` files found in the specified path.")
+        print("No matching `.safetensors` files found in the specified path.")
         return None
 
     current_index = 0
@@ -17,14 +35,10 @@ def display_models_in_path(folder_path):
 
     while current_index < len(files):
         page_files = files[current_index:current_index + page_size]
-        column1 = page_files[:len(page_files) // 2]
-        column2 = page_files[len(page_files) // 2:]
 
         print("\nModels:")
-        for i in range(max(len(column1), len(column2))):
-            left = f"{current_index + i + 1}: {column1[i]}" if i < len(column1) else ""
-            right = f"{current_index + len(column1) + i + 1}: {column2[i]}" if i < len(column2) else ""
-            print(f"{left:<40} {right}")
+        for i, name in enumerate(page_files, start=current_index + 1):
+            print(f"{i:>4}: {describe_line(name, index[name])}")
 
         current_index += page_size
         if current_index < len(files):
@@ -34,33 +48,87 @@ def display_models_in_path(folder_path):
 
 def random_loras_and_weights(folder_path, count):
     """
-    Selects random LoRAs from the folder and generates random weights summing to 1.0,
-    rounded to two decimal places.
+    Selects random LoRAs from the folder, optionally filtered through the LoRA index and
+    optionally avoiding near-duplicates by their weight fingerprints, and generates random
+    weights summing to 1.0, rounded to two decimal places. All picks share one family and
+    rank, since the merge sums them.
     """
-    files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.safetensors')]
-    if len(files) < count:
-        print(f"Error: Only {len(files)} LoRAs available, but {count} required.")
+    files, index = filtered_models(folder_path)
+    groups = {name: merge_group(index[name]) for name in files}
+    sizes = Counter(group for group in groups.values() if group is not None)
+    eligible = [name for name in files if groups[name] is not None and sizes[groups[name]] >= count]
+    if not eligible:
+        print(f"Error: No family and rank has {count} LoRAs to merge ({len(files)} LoRAs available).")
         return None, None
 
-    selected_files = random.sample(files, count)
-    weights = [random.random() for _ in range(count)]
-    total_weight = sum(weights)
-    normalized_weights = [round(w / total_weight, 2) for w in weights]
+    dissimilar = input("Pick dissimilar LoRAs by their weights? (yes/no, default yes): ").strip().lower()
+    if dissimilar in ("", "yes", "y"):
+        selected_files = diverse_sample(update_fingerprints(folder_path, index), files, count, groups=groups)
+        if selected_files is None:
+            print(f"Error: No family and rank has {count} fingerprinted LoRAs to merge.")
+            return None, None
+    else:
+        first = random.choice(eligible)
+        same_group = [name for name in eligible if groups[name] == groups[first] and name != first]
+        selected_files = [first] + random.sample(same_group, count - 1)
+    return [os.path.join(folder_path, f) for f in selected_files], random_weights(count)
 
-    # Adjust the last weight to ensure the sum equals exactly 1.0
-    normalized_weights[-1] = round(1.0 - sum(normalized_weights[:-1]), 2)
+def run_native_merge(selected_models, selected_ratios, precision, save_to, rank=None):
+    """
+    Shows the merge and runs it in-process, with lora_svd when a target 'rank' is given
+    and lora_merge otherwise.
+    """
+    print("\nMerge:")
+    for model, ratio in zip(selected_models, selected_ratios):
+        print(f"  {ratio:>6}  {model}")
+    rank_text = f", rank: {rank}" if rank else ""
+    print(f"Save precision: {precision}{rank_text}, saving to: {save_to}")
+    run_merge = input("Do you want to run this merge? (yes/no): ").strip().lower()
+
+    if run_merge == "yes":
+        print("Merging...")
+        try:
+            if rank:
+                report_path = os.path.splitext(save_to)[0] + "_svd_report.json"
+                summary, cached = cached_merge(
+                    selected_models, selected_ratios, save_to, "svd", precision,
+                    lambda: svd_merge_loras(selected_models, selected_ratios, save_to, rank, precision,
+                                            report_path=report_path),
+                    rank=rank,
+                )
+                if not cached:
+                    print(f"SVD Merge completed in {summary['seconds']:.1f}s, per-layer errors saved to {report_path}")
+            else:
+                summary, cached = cached_merge(
+                    selected_models, selected_ratios, save_to, "flux", precision,
+                    lambda: merge_loras(selected_models, selected_ratios, save_to, precision, shuffle=True),
+                    shuffle=True,
+                )
+                if not cached:
+                    print(f"Flux Merge completed in {summary['seconds']:.1f}s.")
+            if cached:
+                print(f"Identical merge found in the merge cache, saved to {save_to}")
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+    else:
+        print("Merge not executed.")
 
-    return selected_files, normalized_weights
+def ask_svd_settings():
+    """
+    Asks for the rank and save precision of an SVD merge. Returns (rank, precision), rank is None on bad input.
+    """
+    try:
+        rank = int(input("Enter the rank of the merged LoRA (e.g., 4): ").strip())
+    except ValueError:
+        print("Please enter a valid number.")
+        return None, None
+    precision = input("Enter the save precision (fp16, bf16 or fp32): ").strip()
+    return rank, precision
 
 def run_flux_merge_random():
     """
     Runs Flux Merge with random LoRAs and weights.
     """
-    script_path = r"H:\sd-scripts\networks\flux_merge_lora.py"
-    if not os.path.exists(script_path):
-        print(f"Error: The script '{script_path}' does not exist.")
-        return
-
     lora_count = int(input("Enter the number of LoRAs to use: ").strip())
     folder_path = input("Enter the path to the folder containing LoRA models: ").strip()
 
@@ -72,39 +140,15 @@ def run_flux_merge_random():
     if not selected_files:
         return
 
-    precision = input("Enter the precision (e.g., fp16 or fp32): ").strip()
+    precision = input("Enter the save precision (fp16, bf16 or fp32): ").strip()
     save_to = input("Enter the path to save the merged LoRA file (e.g., C:\\output.safetensors): ").strip()
 
-    command = [
-        "python", script_path,
-        "--precision", precision,
-        "--save_precision", precision,
-        "--save_to", save_to,
-        "--models", *selected_files,
-        "--ratios", *map(str, normalized_weights),
-        "--diffusers", "--shuffle", "--no_metadata"
-    ]
-
-    print("\nGenerated Command:")
-    print(" ".join(command))
-    run_command = input("Do you want to run this command? (yes/no): ").strip().lower()
-
-    if run_command == "yes":
-        print("Running the command...")
-        subprocess.run(command)
-        print("Flux Merge completed.")
-    else:
-        print("Command not executed.")
+    run_native_merge(selected_files, normalized_weights, precision, save_to)
 
 def run_svd_merge_random():
     """
     Runs SVD Merge with random LoRAs and weights.
     """
-    script_path = r"H:\sd-scripts\networks\svd_merge_lora.py"
-    if not os.path.exists(script_path):
-        print(f"Error: The script '{script_path}' does not exist.")
-        return
-
     lora_count = int(input("Enter the number of LoRAs to use: ").strip())
     folder_path = input("Enter the path to the folder containing LoRA models: ").strip()
 
@@ -116,36 +160,17 @@ def run_svd_merge_random():
     if not selected_files:
         return
 
+    rank, precision = ask_svd_settings()
+    if not rank:
+        return
     save_to = input("Enter the path to save the merged LoRA file (e.g., H:\\output.safetensors): ").strip()
 
-    command = [
-        "python", script_path,
-        "--save_to", save_to,
-        "--models", *selected_files,
-        "--ratios", *map(str, normalized_weights),
-        "--no_metadata"
-    ]
-
-    print("\nGenerated Command:")
-    print(" ".join(command))
-    run_command = input("Do you want to run this command? (yes/no): ").strip().lower()
-
-    if run_command == "yes":
-        print("Running the command...")
-        subprocess.run(command)
-        print("SVD Merge completed.")
-    else:
-        print("Command not executed.")
+    run_native_merge(selected_files, normalized_weights, precision, save_to, rank)
 
 def run_flux_merge():
     """
-    Runs the Flux Merge script with user-defined parameters.
+    Merges user-selected LoRAs with the in-process merge engine.
     """
-    script_path = r"H:\sd-scripts\networks\flux_merge_lora.py"
-    if not os.path.exists(script_path):
-        print(f"Error: The script '{script_path}' does not exist.")
-        return
-
     folder_path = input("Enter the path to the folder containing the LoRA models: ").strip()
     if not os.path.exists(folder_path):
         print(f"Error: The folder '{folder_path}' does not exist.")
@@ -157,41 +182,15 @@ def run_flux_merge():
 
     selected_models, selected_ratios = ask_user_for_models(folder_path, files)
 
-    precision = input("Enter the precision (e.g., fp16 or fp32): ").strip()
+    precision = input("Enter the save precision (fp16, bf16 or fp32): ").strip()
     save_to = input("Enter the path to save the merged LoRA file (e.g., C:\\output.safetensors): ").strip()
 
-    model_list = " ".join(selected_models)
-    ratio_list = " ".join(map(str, selected_ratios))
-    command = [
-        "python", script_path,
-        "--precision", precision,
-        "--save_precision", precision,
-        "--save_to", save_to,
-        "--models", *selected_models,
-        "--ratios", *map(str, selected_ratios),
-        "--diffusers", "--shuffle", "--no_metadata"
-    ]
-
-    print("\nGenerated Command:")
-    print(" ".join(command))
-    run_command = input("Do you want to run this command? (yes/no): ").strip().lower()
-
-    if run_command == "yes":
-        print("Running the command...")
-        subprocess.run(command)
-        print("Flux Merge completed.")
-    else:
-        print("Command not executed.")
+    run_native_merge(selected_models, selected_ratios, precision, save_to)
 
 def run_svd_merge():
     """
-    Runs the SVD Merge script with user-defined parameters.
+    Merges user-selected LoRAs to a target rank with the in-process SVD merge.
     """
-    script_path = r"H:\sd-scripts\networks\svd_merge_lora.py"
-    if not os.path.exists(script_path):
-        print(f"Error: The script '{script_path}' does not exist.")
-        return
-
     folder_path = input("Enter the path to the folder containing the LoRA models: ").strip()
     if not os.path.exists(folder_path):
         print(f"Error: The folder '{folder_path}' does not exist.")
@@ -203,28 +202,12 @@ def run_svd_merge():
 
     selected_models, selected_ratios = ask_user_for_models(folder_path, files)
 
+    rank, precision = ask_svd_settings()
+    if not rank:
+        return
     save_to = input("Enter the path to save the merged LoRA file (e.g., H:\\saveto.safetensors): ").strip()
 
-    model_list = " ".join(selected_models)
-    ratio_list = " ".join(map(str, selected_ratios))
-    command = [
-        "python", script_path,
-        "--save_to", save_to,
-        "--models", *selected_models,
-        "--ratios", *map(str, selected_ratios),
-        "--no_metadata"
-    ]
-
-    print("\nGenerated Command:")
-    print(" ".join(command))
-    run_command = input("Do you want to run this command? (yes/no): ").strip().lower()
-
-    if run_command == "yes":
-        print("Running the command...")
-        subprocess.run(command)
-        print("SVD Merge completed.")
-    else:
-        print("Command not executed.")
+    run_native_merge(selected_models, selected_ratios, precision, save_to, rank)
 
 def ask_user_for_models(folder_path, files):
     """
@@ -272,11 +255,13 @@ def main_menu():
     """
     while True:
         print("\nLoRA Model Merger Menu")
-        print("1. Kohya Flux LoRA Merge - Flux Merge Script")
-        print("2. SVD LoRA Merge - SVD Merge Script")
-        print("3. Random Kohya Flux LoRA Merge - Random LoRAs with Random Weights")
+        print("1. Flux LoRA Merge - In-process Merge")
+        print("2. SVD LoRA Merge - In-process SVD Merge to a Target Rank")
+        print("3. Random Flux LoRA Merge - Random LoRAs with Random Weights")
         print("4. Random SVD LoRA Merge - Random LoRAs with Random Weights")
-        print("5. Quit")
+        print("5. Random Merge Sweep - Many Random Merges in One Run")
+        print("6. Resize LoRA - Reduce the Rank of a LoRA")
+        print("7. Quit")
 
         choice = input("Enter your choice: ").strip()
 
@@ -289,6 +274,10 @@ def main_menu():
         elif choice == "4":
             run_svd_merge_random()
         elif choice == "5":
+            run_sweep_menu()
+        elif choice == "6":
+            run_resize_menu()
+        elif choice == "7":
             print("Exiting the program.")
             break
         else:
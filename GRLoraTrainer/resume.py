@@ -1,9 +1,14 @@
 import os
-import subprocess
 from pathlib import Path
 import re
 from datetime import datetime
 import threading
+from train_monitor import run_training
+from train_queue import submit_job
+from encoder_cache import prepare_encoder_cache
+from train_checkpoints import latest_state, checkpoint_saved_hook
+from dataset_preflight import run_preflight
+from dataset_resize import build_resized_cache, resized_cache_dir
 
 def get_user_input_with_timeout(prompt, default, timeout):
     result = [default]  # Use a list to allow modification within the inner function
@@ -22,29 +27,18 @@ def get_user_input_with_timeout(prompt, default, timeout):
     thread.join(timeout)
     return result[0]
 
-def main():
-    print("Resuming Flux1 Training")
-
-    # Prompt the user for the dataset directory
-    dataset_path = input("Enter the full path to the dataset (e.g., c:\\images\\circles\\5_circles): ").strip()
-
-    # Ensure dataset path exists
-    if not os.path.exists(dataset_path):
-        print(f"Error: The specified dataset path '{dataset_path}' does not exist.")
-        return
-
-    # Automatically use the parent directory of the input path
-    parent_directory = str(Path(dataset_path).parent)
-    dataset_folder_name = Path(dataset_path).name  # Extract the folder name (e.g., "5_circles")
-    print(f"Using parent directory for training data: {parent_directory}")
-    print(f"Dataset folder name extracted: {dataset_folder_name}")
-
+def choose_state_folder(parent_directory):
+    """
+    Lists the folders in 'parent_directory' and returns the one the user picks, or None if there are none.
+    """
     # List all folders in the parent directory
     all_folders = [folder for folder in Path(parent_directory).iterdir() if folder.is_dir()]
+    # Newest first, so the latest saved state is option 1
+    all_folders.sort(key=lambda folder: folder.stat().st_mtime, reverse=True)
 
     if not all_folders:
         print(f"Error: No folders found in {parent_directory}.")
-        return
+        return None
 
     print(f"Folders in {parent_directory}:")
     for idx, folder in enumerate(all_folders, start=1):
@@ -66,6 +60,37 @@ def main():
     # Set the selected folder as the resume path
     state_folder = all_folders[selected_index - 1].name
     resume_path = os.path.join(parent_directory, state_folder)
+    return resume_path
+
+def main():
+    print("Resuming Flux1 Training")
+
+    # Prompt the user for the dataset directory
+    dataset_path = input("Enter the full path to the dataset (e.g., c:\\images\\circles\\5_circles): ").strip()
+
+    # Ensure dataset path exists
+    if not os.path.exists(dataset_path):
+        print(f"Error: The specified dataset path '{dataset_path}' does not exist.")
+        return
+
+    # Automatically use the parent directory of the input path
+    parent_directory = str(Path(dataset_path).parent)
+    dataset_folder_name = Path(dataset_path).name  # Extract the folder name (e.g., "5_circles")
+    print(f"Using parent directory for training data: {parent_directory}")
+    print(f"Dataset folder name extracted: {dataset_folder_name}")
+
+    # The checkpoint index knows the newest complete state, so offer it before listing every folder
+    resume_path, state = latest_state(parent_directory, dataset_folder_name)
+    if resume_path:
+        print(f"Newest saved state: {Path(resume_path).name} (step {state['step']}, epoch {state['epoch']})")
+        use_latest = input("Resume from this state? (yes/no): ").strip().lower()
+        if use_latest not in ["yes", "y"]:
+            resume_path = None
+
+    if resume_path is None:
+        resume_path = choose_state_folder(parent_directory)
+        if resume_path is None:
+            return
     print(f"Selected resume path: {resume_path}")
 
     # Count the number of images in the provided directory
@@ -94,6 +119,27 @@ def main():
     # Get the selected resolution value
     selected_resolution = resolution_options[resolution]
 
+    # Check the dataset before committing hours of GPU time to it
+    if not run_preflight(dataset_path, selected_resolution):
+        print("Training aborted by the user.")
+        return
+
+    # The dataset's own config from trainlora.py, or the shared config.toml older runs wrote
+    config_file_path = os.path.join(parent_directory, f"{dataset_folder_name}_config.toml")
+    if not os.path.exists(config_file_path):
+        config_file_path = os.path.join(parent_directory, "config.toml")
+    try:
+        with open(config_file_path, "r") as config_file:
+            config_content = config_file.read()
+    except OSError:
+        print(f"Error: No training config found at '{config_file_path}'.")
+        return
+
+    # Bring the pre-resized image cache up to date if the training config uses one
+    image_dir = dataset_path
+    if resized_cache_dir(dataset_path, selected_resolution).name in config_content:
+        image_dir = str(build_resized_cache(dataset_path, selected_resolution))
+
     # Prompt the user for sample generation steps with a timeout
     generate_sample_steps = get_user_input_with_timeout(
         "Enter the sample generation interval in steps (default: 250): ", 250, 30
@@ -115,9 +161,6 @@ def main():
     clip_model_path = "E:\\models\\clip_l.safetensors"
     t5_model_path = "E:\\models\\t5xxl_fp16.safetensors"
 
-    # Create the configuration file in the parent folder
-    config_file_path = os.path.join(parent_directory, "config.toml")
-
     # Build the training command
     command = [
         "python", flux_train_script,
@@ -167,10 +210,22 @@ def main():
     print(" ".join(command))
 
     # Confirm execution
-    confirm = input("\nDo you want to execute this command? (yes/no): ").strip().lower()
+    confirm = input("\nDo you want to execute this command? (yes/no/queue): ").strip().lower()
     if confirm in ["yes", "y"]:
-        # Run the command
-        subprocess.run(command)
+        # Copy in latents and text-encoder outputs cached by earlier runs, so unchanged images and captions skip encoding
+        encoder_cache = prepare_encoder_cache(image_dir, selected_resolution, ae_path, clip_model_path, t5_model_path,
+                                              command)
+        # Run the command, recording step rate, loss and time spent sampling and saving
+        metrics_path = os.path.join(parent_directory, f"{dataset_folder_name}_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+        run_training(command, metrics_path, on_event=checkpoint_saved_hook(parent_directory, dataset_folder_name))
+        # Keep whatever this run encoded for the next one
+        encoder_cache.store(image_dir)
+    elif confirm in ["queue", "q"]:
+        # Leave the run to the training queue so several datasets can go back to back
+        job_id = submit_job(dataset_folder_name, command, parent_directory, dataset_folder_name,
+                            dataset_config=config_content,
+                            encoder_cache=[image_dir, selected_resolution, ae_path, clip_model_path, t5_model_path])
+        print(f"Training queued as job {job_id}. Run it from the Training Queue option in loramenu.py.")
     else:
         print("Training aborted by the user.")
 
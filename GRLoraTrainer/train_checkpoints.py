@@ -0,0 +1,169 @@
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+
+# Retention for --save_state folders: the newest keep_last are kept, plus every keep_every-th save
+# by its step or epoch number, so a long run keeps a sparse history without filling the disk.
+# The final "<name>-state" folder is always kept. Set keep_last to 0 to disable pruning.
+default_keep_last = 3
+default_keep_every = 4
+
+def index_path(output_dir, output_name):
+    return Path(output_dir) / f"{output_name}_checkpoints.json"
+
+def checkpoint_pattern(output_name):
+    """
+    Matches kohya's saved names for 'output_name': "-step00000500" or "-000001" suffixes for
+    step and epoch saves, "-state" for states and ".safetensors" for models.
+    """
+    return re.compile(re.escape(output_name) + r"(?:-step(?P<step>\d+)|-(?P<epoch>\d+))?(?P<kind>-state|\.safetensors)$")
+
+def read_train_state(state_dir):
+    """
+    Returns the train_state.json kohya writes into each state folder, or None if it is missing.
+    """
+    try:
+        with open(os.path.join(state_dir, "train_state.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def load_index(output_dir, output_name):
+    try:
+        with open(index_path(output_dir, output_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(output_dir, output_name, index):
+    path = index_path(output_dir, output_name)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+
+def update_index(output_dir, output_name):
+    """
+    Brings the checkpoint index for 'output_name' up to date with one directory listing.
+    Only folders not seen before are opened, to read their step and epoch.
+    Returns the index: {name: {"kind", "step", "epoch", "time", "valid"}}.
+    """
+    pattern = checkpoint_pattern(output_name)
+    previous = load_index(output_dir, output_name)
+    index = {}
+    try:
+        entries = list(os.scandir(output_dir))
+    except OSError:
+        return {}
+
+    for entry in entries:
+        match = pattern.match(entry.name)
+        if not match:
+            continue
+        kind = "state" if match.group("kind") == "-state" else "model"
+        mtime = entry.stat().st_mtime
+        known = previous.get(entry.name)
+        if known and known.get("time") == mtime and known.get("valid"):
+            index[entry.name] = known
+            continue
+
+        record = {
+            "kind": kind,
+            "step": int(match.group("step")) if match.group("step") else None,
+            "epoch": int(match.group("epoch")) if match.group("epoch") else None,
+            "time": mtime,
+            "valid": entry.is_file() if kind == "model" else False,
+        }
+        if kind == "state" and entry.is_dir():
+            train_state = read_train_state(entry.path)
+            # A state is only usable once kohya has finished writing train_state.json into it
+            record["valid"] = train_state is not None
+            if train_state:
+                record["step"] = train_state.get("current_step", record["step"])
+                record["epoch"] = train_state.get("current_epoch", record["epoch"])
+        index[entry.name] = record
+
+    if index != previous:
+        save_index(output_dir, output_name, index)
+    return index
+
+def latest_state(output_dir, output_name):
+    """
+    Returns (path, record) for the newest valid saved state of 'output_name', or (None, None).
+    """
+    index = update_index(output_dir, output_name)
+    states = [(name, r) for name, r in index.items() if r["kind"] == "state" and r["valid"]]
+    if not states:
+        return None, None
+    name, record = max(states, key=lambda item: item[1]["time"])
+    return os.path.join(output_dir, name), record
+
+def prune_states(output_dir, output_name, keep_last=default_keep_last, keep_every=default_keep_every):
+    """
+    Deletes saved states outside the retention policy and returns the names removed.
+    Incomplete states are only removed once a newer valid state exists.
+    """
+    if keep_last <= 0:
+        return []
+    index = update_index(output_dir, output_name)
+    states = sorted(
+        ((name, r) for name, r in index.items() if r["kind"] == "state" and name != f"{output_name}-state"),
+        key=lambda item: item[1]["time"],
+    )
+    valid = [name for name, r in states if r["valid"]]
+    keep = set(valid[-keep_last:])
+    if keep_every > 0:
+        # Sparse keepers are chosen by the save's number in its name, which does not shift as older
+        # states are pruned. Step saves are numbered in units of the save interval, the gcd of their
+        # steps, which is exact as soon as two consecutive saves exist and keep_last holds those.
+        pattern = checkpoint_pattern(output_name)
+        numbers = {name: pattern.match(name).group("step", "epoch") for name in valid}
+        interval = math.gcd(*(int(step) for step, _ in numbers.values() if step))
+        for name, (step, epoch) in numbers.items():
+            number = int(step) // interval if step else int(epoch or 0)
+            if number and number % keep_every == 0:
+                keep.add(name)
+    newest_valid_time = index[valid[-1]]["time"] if valid else None
+
+    removed = []
+    for name, record in states:
+        if name in keep:
+            continue
+        if not record["valid"] and (newest_valid_time is None or record["time"] >= newest_valid_time):
+            continue
+        shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+        removed.append(name)
+
+    if removed:
+        for name in removed:
+            index.pop(name, None)
+        save_index(output_dir, output_name, index)
+    return removed
+
+def checkpoint_saved_hook(output_dir, output_name, keep_last=default_keep_last, keep_every=default_keep_every):
+    """
+    Returns a run_training event callback that re-indexes and prunes after every save.
+    """
+    def on_event(event, fields):
+        if event == "save_done":
+            for name in prune_states(output_dir, output_name, keep_last, keep_every):
+                print(f"\nPruned old state: {name}")
+    return on_event
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python train_checkpoints.py <output_dir> <output_name> [--prune]")
+    else:
+        index = update_index(sys.argv[1], sys.argv[2])
+        for name, record in sorted(index.items(), key=lambda item: item[1]["time"]):
+            saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["time"]))
+            status = "" if record["valid"] else "  (incomplete)"
+            print(f"{saved}  {record['kind']:<5}  step {record['step']}  epoch {record['epoch']}  {name}{status}")
+        if "--prune" in sys.argv:
+            for name in prune_states(sys.argv[1], sys.argv[2]):
+                print(f"Pruned old state: {name}")
@@ -0,0 +1,194 @@
+import codecs
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# kohya's tqdm bar, e.g. "steps:  12%|██    | 120/1000 [02:10<15:20,  1.05s/it, avr_loss=0.123]"
+progress_pattern = re.compile(
+    r"steps:\s*\d+%\|[^|]*\|\s*(\d+)/(\d+)\s*\[([\d:]+)<([\d:?]+),\s*([\d.]+)\s*(s/it|it/s)"
+    r"(?:,\s*avr_loss=([-+\d.eE]+))?"
+)
+epoch_pattern = re.compile(r"^\s*epoch (\d+)/(\d+)")
+sample_pattern = re.compile(r"generating sample images at step")
+save_pattern = re.compile(r"saving (checkpoint|state at (?:step|epoch))[: ]*(.*)")
+
+def parse_duration(text):
+    """
+    Converts a tqdm "[H:]MM:SS" duration to seconds, None for "?".
+    """
+    if "?" in text:
+        return None
+    seconds = 0
+    for part in text.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def format_duration(seconds):
+    """
+    Formats seconds as H:MM:SS.
+    """
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class TrainingMonitor:
+    """
+    Interprets kohya training output: records step rate, loss and ETA, and splits wall-clock time
+    into startup, training, sample generation and checkpoint saving. Every event is appended to a
+    JSONL file and a one-line status is kept on the console.
+    """
+    def __init__(self, metrics_path, on_event=None):
+        self.on_event = on_event
+        self.metrics_file = open(metrics_path, "a", encoding="utf-8")
+        self.start = time.time()
+        self.phase = "startup"
+        self.phase_start = self.start
+        self.phase_totals = {"startup": 0.0, "train": 0.0, "sample": 0.0, "save": 0.0}
+        self.current_event = None
+        self.step = 0
+        self.total_steps = None
+        self.last_progress = {}
+        self.last_status = 0.0
+
+    def write(self, event, **fields):
+        now = time.time()
+        record = {"time": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+                  "elapsed_s": round(now - self.start, 2), "event": event, **fields}
+        self.metrics_file.write(json.dumps(record) + "\n")
+        self.metrics_file.flush()
+        if self.on_event:
+            self.on_event(event, fields)
+
+    def enter_phase(self, phase, **fields):
+        """
+        Closes the running phase, logging how long a sample or save took, and starts 'phase'.
+        """
+        now = time.time()
+        duration = now - self.phase_start
+        self.phase_totals[self.phase] += duration
+        if self.phase in ("sample", "save") and self.current_event:
+            self.write(f"{self.phase}_done", duration_s=round(duration, 2), **self.current_event)
+            self.current_event = None
+        self.phase = phase
+        self.phase_start = now
+        if phase in ("sample", "save"):
+            self.current_event = {"step": self.step, **fields}
+            self.write(f"{phase}_start", **self.current_event)
+
+    def handle_line(self, line):
+        """
+        Processes one line (or tqdm redraw) of output. Returns True if it was a progress update
+        that the status line replaces.
+        """
+        match = progress_pattern.search(line)
+        if match:
+            step, total = int(match.group(1)), int(match.group(2))
+            rate = float(match.group(5))
+            seconds_per_step = rate if match.group(6) == "s/it" else (1 / rate if rate else None)
+            if step != self.step or self.phase != "train":
+                if self.phase != "train":
+                    self.enter_phase("train")
+                self.step, self.total_steps = step, total
+                self.last_progress = {
+                    "step": step,
+                    "total_steps": total,
+                    "seconds_per_step": seconds_per_step,
+                    "it_per_s": 1 / seconds_per_step if seconds_per_step else None,
+                    "loss": float(match.group(7)) if match.group(7) else None,
+                    "eta_s": parse_duration(match.group(4)),
+                }
+                self.write("step", **self.last_progress)
+            self.print_status()
+            return True
+
+        match = epoch_pattern.search(line)
+        if match:
+            self.write("epoch", epoch=int(match.group(1)), total_epochs=int(match.group(2)))
+        elif sample_pattern.search(line):
+            self.enter_phase("sample")
+        else:
+            match = save_pattern.search(line)
+            if match:
+                self.enter_phase("save", kind=match.group(1).split()[0], target=match.group(2).strip())
+        return False
+
+    def print_status(self, force=False):
+        now = time.time()
+        if not force and now - self.last_status < 0.5:
+            return
+        self.last_status = now
+        progress = self.last_progress
+        parts = [f"step {progress.get('step', 0)}/{progress.get('total_steps') or '?'}"]
+        if progress.get("seconds_per_step"):
+            parts.append(f"{progress['seconds_per_step']:.2f} s/it")
+        if progress.get("loss") is not None:
+            parts.append(f"loss {progress['loss']:.4f}")
+        if progress.get("eta_s") is not None:
+            parts.append(f"ETA {format_duration(progress['eta_s'])}")
+        parts.append(f"sampling {format_duration(self.phase_totals['sample'])}")
+        parts.append(f"saving {format_duration(self.phase_totals['save'])}")
+        sys.stdout.write("\r" + " | ".join(parts) + "   ")
+        sys.stdout.flush()
+
+    def finish(self, return_code):
+        if self.last_progress:
+            self.print_status(force=True)
+        self.enter_phase("finished")
+        totals = {phase: round(seconds, 2) for phase, seconds in self.phase_totals.items()}
+        self.write("summary", return_code=return_code, total_s=round(time.time() - self.start, 2),
+                   phase_s=totals, steps=self.step)
+        self.metrics_file.close()
+
+        print("\n\nTraining wall-clock breakdown:")
+        total = sum(totals.values()) or 1
+        for phase, seconds in totals.items():
+            print(f"  {phase:<8} {format_duration(seconds)} ({seconds / total:.0%})")
+
+def run_training(command, metrics_path, on_event=None):
+    """
+    Runs the kohya training command, streaming its output through a TrainingMonitor.
+    'on_event' is called with (event, fields) for every recorded event.
+    Returns the process return code.
+    """
+    print(f"Writing training metrics to: {metrics_path}")
+    monitor = TrainingMonitor(metrics_path, on_event)
+    monitor.write("launch", command=command)
+
+    # Unbuffered so progress arrives as it happens instead of in pipe-sized chunks
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+    # Incremental so a multi-byte character split across reads still decodes
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    showing_status = False
+    try:
+        while True:
+            chunk = os.read(process.stdout.fileno(), 65536)
+            if not chunk:
+                break
+            # tqdm redraws with carriage returns, so both \r and \n end a line
+            parts = re.split(r"[\r\n]", pending + decoder.decode(chunk))
+            pending = parts.pop()
+            for line in parts:
+                if not line.strip():
+                    continue
+                if monitor.handle_line(line):
+                    showing_status = True
+                else:
+                    if showing_status:
+                        sys.stdout.write("\n")
+                        showing_status = False
+                    print(line)
+        if pending.strip() and not monitor.handle_line(pending):
+            print(pending)
+        return_code = process.wait()
+    except KeyboardInterrupt:
+        # Stop the trainer, keep the metrics, then let the caller see the interrupt like subprocess.run would
+        process.terminate()
+        monitor.finish(process.wait())
+        raise
+    monitor.finish(return_code)
+    return return_code
@@ -0,0 +1,116 @@
+import os
+import shutil
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+from train_monitor import run_training, format_duration
+
+def set_arg(command, name, value=None):
+    """
+    Returns 'command' with every "--name=..." argument replaced by "--name=value",
+    or removed when 'value' is None.
+    """
+    prefix = f"--{name}="
+    command = [arg for arg in command if not arg.startswith(prefix)]
+    if value is not None:
+        command.append(f"{prefix}{value}")
+    return command
+
+def calibrate(command, steps=40):
+    """
+    Runs a short training with the real model, resolution and dataset into a scratch folder,
+    sampling and saving once at the end, and returns the measured costs:
+    startup seconds, seconds per step, seconds per sample generation and per checkpoint save.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="lora_calibration_")
+    calibration = set_arg(command, "max_train_epochs")
+    calibration = set_arg(calibration, "output_dir", scratch_dir)
+    calibration = set_arg(calibration, "max_train_steps", steps)
+    calibration = set_arg(calibration, "sample_every_n_steps", steps)
+    calibration = set_arg(calibration, "save_every_n_steps", steps)
+    calibration = set_arg(calibration, "save_every_n_epochs", 10000)
+
+    events = []
+    print(f"\nCalibrating with a {steps}-step run...")
+    try:
+        return_code = run_training(calibration, os.path.join(scratch_dir, "calibration_metrics.jsonl"),
+                                   on_event=lambda event, fields: events.append((event, fields)))
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    if return_code != 0:
+        print("Calibration run failed.")
+        return None
+
+    step_times = [f["seconds_per_step"] for e, f in events if e == "step" and f.get("seconds_per_step")]
+    if not step_times:
+        print("Calibration run reported no training steps.")
+        return None
+    # The first steps include warm-up, the rate reported over the second half is representative
+    steady = step_times[len(step_times) // 2:]
+    summary = next((f for e, f in events if e == "summary"), {})
+    sample_times = [f["duration_s"] for e, f in events if e == "sample_done"]
+    save_times = [f["duration_s"] for e, f in events if e == "save_done"]
+    return {
+        "startup_s": summary.get("phase_s", {}).get("startup", 0.0),
+        "seconds_per_step": statistics.median(steady),
+        "sample_s": sum(sample_times) / len(sample_times) if sample_times else 0.0,
+        # A save at a step writes both the model and the --save_state folder
+        "save_s": sum(save_times) if save_times else 0.0,
+    }
+
+def round_interval(value, step=50):
+    """
+    Rounds a step interval to a multiple of 'step', never below 'step'.
+    """
+    return max(step, int(round(value / step)) * step)
+
+def plan_training(costs, budget_seconds, steps_per_epoch, max_steps, samples=10, saves=10):
+    """
+    Picks max_train_steps and save/sample intervals so the run, including startup, roughly
+    'samples' sample generations and 'saves' checkpoint saves plus the per-epoch saves, fits in
+    'budget_seconds'. Steps are capped at 'max_steps'. Returns the plan with its predicted duration.
+    """
+    per_step = costs["seconds_per_step"]
+    # Per-epoch saves scale with the number of steps, so they are folded into the step cost
+    per_step_with_epoch_saves = per_step + costs["save_s"] / max(1, steps_per_epoch)
+    fixed = costs["startup_s"] + samples * costs["sample_s"] + saves * costs["save_s"]
+    steps = int((budget_seconds - fixed) / per_step_with_epoch_saves)
+    steps = max(1, min(steps, max_steps))
+
+    sample_every = round_interval(steps / samples)
+    save_every = round_interval(steps / saves)
+    predicted = (costs["startup_s"] + steps * per_step
+                 + (steps // sample_every) * costs["sample_s"]
+                 + (steps // save_every + steps // max(1, steps_per_epoch)) * costs["save_s"])
+    return {
+        "max_train_steps": steps,
+        "sample_every_n_steps": sample_every,
+        "save_every_n_steps": save_every,
+        "predicted_s": predicted,
+        "epochs": steps / max(1, steps_per_epoch),
+    }
+
+def plan_with_calibration(command, budget_hours, steps_per_epoch, max_steps):
+    """
+    Calibrates, plans for 'budget_hours' and returns the command rewritten with the plan,
+    or None if calibration failed. kohya lets --max_train_epochs override --max_train_steps,
+    so it is dropped from the planned command.
+    """
+    costs = calibrate(command)
+    if costs is None:
+        return None
+    print(f"\nMeasured: {costs['seconds_per_step']:.2f} s/step, startup {format_duration(costs['startup_s'])}, "
+          f"sampling {costs['sample_s']:.0f}s each, saving {costs['save_s']:.0f}s each")
+
+    plan = plan_training(costs, budget_hours * 3600, steps_per_epoch, max_steps)
+    finish = datetime.now() + timedelta(seconds=plan["predicted_s"])
+    print(f"Plan: {plan['max_train_steps']} steps ({plan['epochs']:.1f} epochs), "
+          f"sample every {plan['sample_every_n_steps']}, save every {plan['save_every_n_steps']} steps")
+    if plan["max_train_steps"] == max_steps:
+        print("The full default schedule fits in the budget.")
+    print(f"Predicted duration {format_duration(plan['predicted_s'])}, finishing around {finish.strftime('%Y-%m-%d %H:%M')}")
+
+    planned = set_arg(command, "max_train_epochs")
+    for name in ("max_train_steps", "sample_every_n_steps", "save_every_n_steps"):
+        planned = set_arg(planned, name, plan[name])
+    return planned
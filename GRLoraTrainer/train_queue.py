@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from train_monitor import run_training, format_duration
+from train_checkpoints import latest_state, checkpoint_saved_hook
+from encoder_cache import prepare_encoder_cache
+
+# The queue outlives any one dataset, so it lives next to the other shared caches
+default_queue_path = Path.home() / ".grloratrainer" / "train_queue.db"
+
+@contextmanager
+def open_queue(db_path=default_queue_path):
+    """
+    Opens the job queue database, creating it on first use. Use with 'with': the changes are
+    committed, or rolled back on an error, and the connection is closed on leaving the block.
+    """
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, command TEXT NOT NULL, "
+        "output_dir TEXT NOT NULL, output_name TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0, "
+        "status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, "
+        "created REAL NOT NULL, started REAL, finished REAL, run_seconds REAL NOT NULL DEFAULT 0, "
+        "return_code INTEGER, last_resume TEXT)"
+    )
+    # Columns added after the first release: the job's dataset config and its encoder cache settings
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column in ("dataset_config", "encoder_cache"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+    conn.commit()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def submit_job(name, command, output_dir, output_name, priority=0, dataset_config=None, encoder_cache=None,
+               db_path=default_queue_path):
+    """
+    Adds a training command to the queue and returns its job id.
+    'dataset_config' is the text of the command's --dataset_config file, written out again when the job
+    starts so later runs cannot change it. 'encoder_cache' is [image_dir, resolution, ae, clip_l, t5],
+    the arguments of prepare_encoder_cache, so the job shares cached latents and text-encoder outputs.
+    """
+    with open_queue(db_path) as conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (name, command, output_dir, output_name, priority, created, dataset_config, encoder_cache) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, json.dumps(command), str(output_dir), output_name, priority, time.time(), dataset_config,
+             json.dumps(encoder_cache) if encoder_cache else None),
+        )
+        return cursor.lastrowid
+
+def list_jobs(db_path=default_queue_path):
+    """
+    Returns every job, in the order the runner would pick queued ones.
+    """
+    with open_queue(db_path) as conn:
+        return conn.execute("SELECT * FROM jobs ORDER BY priority DESC, created, id").fetchall()
+
+def cancel_job(job_id, db_path=default_queue_path):
+    """
+    Cancels a job that has not finished. Returns False if there was no such job.
+    """
+    with open_queue(db_path) as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'cancelled' WHERE id = ? AND status IN ('queued', 'interrupted', 'failed')",
+            (job_id,),
+        )
+        return cursor.rowcount > 0
+
+def set_priority(job_id, priority, db_path=default_queue_path):
+    """
+    Changes a job's priority, higher runs first. Returns False if there was no such job.
+    """
+    with open_queue(db_path) as conn:
+        return conn.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, job_id)).rowcount > 0
+
+def requeue_job(job_id, db_path=default_queue_path):
+    """
+    Puts a failed or cancelled job back in the queue, it resumes from its newest saved state.
+    """
+    with open_queue(db_path) as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued' WHERE id = ? AND status IN ('failed', 'cancelled', 'interrupted')",
+            (job_id,),
+        )
+        return cursor.rowcount > 0
+
+def with_resume(command, resume_path):
+    """
+    Returns 'command' with its --resume argument pointing at 'resume_path'.
+    """
+    command = [arg for arg in command if not arg.startswith("--resume=")]
+    return command + [f"--resume={resume_path}"]
+
+def write_dataset_config(command, dataset_config):
+    """
+    Writes a job's stored dataset config to the file its command's --dataset_config points at.
+    """
+    for arg in command:
+        if arg.startswith("--dataset_config="):
+            with open(arg.split("=", 1)[1], "w") as config_file:
+                config_file.write(dataset_config)
+
+def run_queue(db_path=default_queue_path):
+    """
+    Runs queued jobs back to back until the queue is empty. Jobs left 'running' by a runner
+    that died, and jobs that had started before, resume from their newest saved state.
+    Ctrl+C stops the current job and leaves it queued as interrupted.
+    """
+    with open_queue(db_path) as conn:
+        stale = conn.execute("UPDATE jobs SET status = 'interrupted' WHERE status = 'running'").rowcount
+    if stale:
+        print(f"Marked {stale} job(s) from a previous runner as interrupted, they will resume.")
+
+    while True:
+        with open_queue(db_path) as conn:
+            job = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'interrupted') ORDER BY priority DESC, created, id LIMIT 1"
+            ).fetchone()
+            if job is None:
+                print("\nTraining queue is empty.")
+                return
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started = COALESCE(started, ?) WHERE id = ?",
+                (time.time(), job["id"]),
+            )
+
+        command = json.loads(job["command"])
+        resume_path = latest_state(job["output_dir"], job["output_name"])[0] if job["attempts"] else None
+        if resume_path:
+            command = with_resume(command, resume_path)
+            print(f"\nResuming job {job['id']} ({job['name']}) from {resume_path}")
+        else:
+            print(f"\nStarting job {job['id']} ({job['name']})")
+
+        if job["dataset_config"]:
+            write_dataset_config(command, job["dataset_config"])
+        # Copy in what other runs encoded since the job was queued, and keep what this one encodes
+        encoder_cache = None
+        if job["encoder_cache"]:
+            encoder_settings = json.loads(job["encoder_cache"])
+            encoder_cache = prepare_encoder_cache(*encoder_settings, command=command)
+
+        metrics_path = os.path.join(
+            job["output_dir"], f"{job['output_name']}_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        )
+        start_time = time.time()
+        interrupted = False
+        try:
+            return_code = run_training(command, metrics_path,
+                                       on_event=checkpoint_saved_hook(job["output_dir"], job["output_name"]))
+        except KeyboardInterrupt:
+            return_code, interrupted = None, True
+        elapsed = time.time() - start_time
+        if encoder_cache:
+            encoder_cache.store(encoder_settings[0])
+
+        if interrupted:
+            status = "interrupted"
+        else:
+            status = "done" if return_code == 0 else "failed"
+        with open_queue(db_path) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, run_seconds = run_seconds + ?, return_code = ?, "
+                "last_resume = ? WHERE id = ?",
+                (status, time.time(), elapsed, return_code, resume_path, job["id"]),
+            )
+        print(f"Job {job['id']} {status} after {format_duration(elapsed)}.")
+        if interrupted:
+            print("Queue runner stopped, the interrupted job will resume on the next run.")
+            return
+
+def print_jobs(db_path=default_queue_path):
+    """
+    Prints the queue as a table.
+    """
+    jobs = list_jobs(db_path)
+    if not jobs:
+        print("\nThe training queue is empty.")
+        return
+    print(f"\n{'ID':>4}  {'Status':<11} {'Pri':>3}  {'Tries':>5}  {'Run time':>9}  Name")
+    for job in jobs:
+        print(f"{job['id']:>4}  {job['status']:<11} {job['priority']:>3}  {job['attempts']:>5}  "
+              f"{format_duration(job['run_seconds']):>9}  {job['name']}")
+
+def queue_menu():
+    """
+    Interactive menu for managing and running the training queue.
+    """
+    while True:
+        print("\nTraining Queue Menu")
+        print("1. List Jobs")
+        print("2. Run Queue")
+        print("3. Cancel Job")
+        print("4. Change Job Priority")
+        print("5. Requeue Job")
+        print("6. Back")
+
+        choice = input("Enter your choice: ").strip()
+
+        try:
+            if choice == "1":
+                print_jobs()
+            elif choice == "2":
+                run_queue()
+            elif choice == "3":
+                job_id = int(input("Enter the job ID to cancel: ").strip())
+                print("Job cancelled." if cancel_job(job_id) else "No cancellable job with that ID.")
+            elif choice == "4":
+                job_id = int(input("Enter the job ID: ").strip())
+                priority = int(input("Enter the new priority (higher runs first): ").strip())
+                print("Priority updated." if set_priority(job_id, priority) else "No job with that ID.")
+            elif choice == "5":
+                job_id = int(input("Enter the job ID to requeue: ").strip())
+                print("Job requeued." if requeue_job(job_id) else "No failed or cancelled job with that ID.")
+            elif choice == "6":
+                break
+            else:
+                print("Invalid choice. Please try again.")
+        except ValueError:
+            print("Invalid input. Please enter a number.")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "run":
+        run_queue()
+    elif len(sys.argv) > 1 and sys.argv[1] == "list":
+        print_jobs()
+    else:
+        queue_menu()
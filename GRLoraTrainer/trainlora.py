@@ -1,9 +1,15 @@
 import os
-import subprocess
 from pathlib import Path
 import re
 from datetime import datetime
 import threading
+from train_monitor import run_training
+from train_queue import submit_job
+from encoder_cache import prepare_encoder_cache
+from train_checkpoints import checkpoint_saved_hook
+from train_planner import plan_with_calibration
+from dataset_preflight import run_preflight
+from dataset_resize import build_resized_cache
 
 def get_user_input_with_timeout(prompt, default, timeout):
     result = [default]  # Use a list to allow modification within the inner function
@@ -73,6 +79,21 @@ def main():
     # Get the selected resolution value
     selected_resolution = resolution_options[resolution]
 
+    # Check the dataset before committing hours of GPU time to it
+    if not run_preflight(dataset_path, selected_resolution):
+        print("Training aborted by the user.")
+        return
+
+    # Optionally train from a copy already resized to the aspect buckets, so the data loader only has to decode
+    # small files. This switches training from square crops to bucketing, so it is only done when asked for.
+    image_dir = dataset_path
+    bucket_settings = ""
+    use_resized_cache = input(f"Train with aspect ratio buckets from a pre-resized image cache at {selected_resolution}? "
+                              "(yes/no) (default: no): ").strip().lower()
+    if use_resized_cache in ["yes", "y"]:
+        image_dir = str(build_resized_cache(dataset_path, selected_resolution))
+        bucket_settings = "enable_bucket = true\n"
+
     # Prompt the user for sample generation steps with a timeout
     generate_sample_steps = get_user_input_with_timeout(
         "Enter the sample generation interval in steps (default: 250): ", 250, 30
@@ -94,8 +115,8 @@ def main():
     clip_model_path = "E:\\models\\clip_l.safetensors"
     t5_model_path = "E:\\models\\t5xxl_fp16.safetensors"
 
-    # Create the configuration file in the parent folder
-    config_file_path = os.path.join(parent_directory, "config.toml")
+    # Create the configuration file in the parent folder, one per dataset so queued runs keep their own
+    config_file_path = os.path.join(parent_directory, f"{dataset_folder_name}_config.toml")
     config_content = f"""[general]
 shuffle_caption = false
 caption_extension = '.txt'
@@ -105,9 +126,9 @@ keep_tokens = 1
 batch_size = 1
 keep_tokens = 1
 resolution = {selected_resolution}
-
+{bucket_settings}
   [[datasets.subsets]]
-  image_dir = '{dataset_path}'
+  image_dir = '{image_dir}'
   class_tokens = ''
   num_repeats = {dataset_digits}
 
@@ -161,15 +182,41 @@ resolution = {selected_resolution}
         "--save_state"
     ]
 
+    # Optionally measure the real seconds per step and fit the schedule to a time budget
+    budget = input("\nEnter a time budget in hours to plan the run with a short calibration (leave blank to skip): ").strip()
+    if budget:
+        try:
+            budget_hours = float(budget)
+        except ValueError:
+            budget_hours = None
+            print("Invalid budget. Keeping the default schedule.")
+        if budget_hours:
+            planned_command = plan_with_calibration(command, budget_hours, number_of_images * dataset_digits, max_train_steps)
+            if planned_command:
+                command = planned_command
+
     # Print the command to verify
     print("\nGenerated training command:")
     print(" ".join(command))
 
     # Confirm execution
-    confirm = input("\nDo you want to execute this command? (yes/no): ").strip().lower()
+    confirm = input("\nDo you want to execute this command? (yes/no/queue): ").strip().lower()
     if confirm in ["yes", "y"]:
-        # Run the command
-        subprocess.run(command)
+        # Copy in latents and text-encoder outputs cached by earlier runs, so unchanged images and captions skip encoding
+        encoder_cache = prepare_encoder_cache(image_dir, selected_resolution, ae_path, clip_model_path, t5_model_path,
+                                              command)
+        # Run the command, recording step rate, loss and time spent sampling and saving
+        metrics_path = os.path.join(parent_directory, f"{dataset_folder_name}_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+        # Old saved states are pruned as new ones land, see train_checkpoints.py for the retention policy
+        run_training(command, metrics_path, on_event=checkpoint_saved_hook(parent_directory, dataset_folder_name))
+        # Keep whatever this run encoded for the next one
+        encoder_cache.store(image_dir)
+    elif confirm in ["queue", "q"]:
+        # Leave the run to the training queue so several datasets can go back to back
+        job_id = submit_job(dataset_folder_name, command, parent_directory, dataset_folder_name,
+                            dataset_config=config_content,
+                            encoder_cache=[image_dir, selected_resolution, ae_path, clip_model_path, t5_model_path])
+        print(f"Training queued as job {job_id}. Run it from the Training Queue option in loramenu.py.")
     else:
         print("Training aborted by the user.")
 
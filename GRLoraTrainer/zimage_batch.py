@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from file_utils import hash_file
+from flux_to_zimage import convert_flux_to_zimage
+from lora_index import detect_family
+from lora_io import read_header
+
+manifest_name = "zimage_manifest.json"
+summary_name = "zimage_conversion_summary.json"
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, manifest_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"hashes": {}, "converted": {}}
+
+def save_json(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def find_flux_loras(source_dir, output_dir):
+    """
+    Walks 'source_dir' and returns the relative paths of the Flux LoRAs in it, skipping the output folder,
+    and a {relative path: error} dict of the .safetensors files whose header could not be read.
+    """
+    output_dir = os.path.abspath(output_dir)
+    found = []
+    unreadable = {}
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and os.path.abspath(os.path.join(root, d)) != output_dir)
+        for name in sorted(files):
+            if not name.endswith(".safetensors"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                tensors, _, _ = read_header(path)
+            except (OSError, ValueError) as e:
+                unreadable[os.path.relpath(path, source_dir)] = str(e) or type(e).__name__
+                continue
+            if detect_family(tensors) == "flux":
+                found.append(os.path.relpath(path, source_dir))
+    return found, unreadable
+
+def source_hash(path, known):
+    """
+    Returns the content hash of 'path', reusing the manifest's hash if its size and mtime are unchanged.
+    """
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if known and known["signature"] == signature:
+        return known["hash"], signature
+    return hash_file(path), signature
+
+def convert_job(job):
+    """
+    Pool worker: hashes one new or changed file, then converts it unless the manifest already has an
+    output for that content, e.g. from a renamed copy. Each conversion streams one module at a time,
+    so a worker's memory stays around one layer whatever the file size.
+    """
+    start_time = time.time()
+    try:
+        digest, signature = source_hash(job["source"], job["known"])
+        result = {"hash": digest, "signature": signature}
+        converted = job["converted"].get(digest)
+        if converted and os.path.exists(os.path.join(job["output_dir"], converted["output"])):
+            result.update({"status": "skipped", "seconds": 0.0, "output": converted["output"]})
+            return result
+        os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+        summary = convert_flux_to_zimage(job["source"], job["output"], job["stream"], job["fit"], job["precision"])
+        result.update({"status": "converted", "seconds": round(time.time() - start_time, 3),
+                       "problems": len(summary["problems"]),
+                       "dropped_single_blocks": summary["dropped_single_blocks"],
+                       "output": os.path.relpath(job["output"], job["output_dir"])})
+        return result
+    except Exception as e:
+        return {"status": "failed", "seconds": round(time.time() - start_time, 3), "error": str(e) or type(e).__name__}
+
+def convert_directory(source_dir, output_dir, stream="img", fit=True, precision=None, workers=None):
+    """
+    Converts every Flux LoRA under 'source_dir' to Z-Image layout in 'output_dir', mirroring the folder
+    structure, on a process pool. A manifest of source content hash -> output lets re-runs skip files
+    already converted, including renamed or moved copies. Unchanged files are skipped from their size
+    and mtime, new or changed ones are hashed in the workers. Writes and returns a summary with the
+    time and outcome of every file, files with unreadable headers counted as failed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    settings = {"stream": stream, "fit": fit, "precision": precision}
+    if manifest.get("settings") != settings:
+        manifest = {"settings": settings, "hashes": manifest.get("hashes", {}), "converted": {}}
+
+    sources, unreadable = find_flux_loras(source_dir, output_dir)
+    print(f"Found {len(sources)} Flux LoRAs under {source_dir}"
+          + (f", {len(unreadable)} unreadable files" if unreadable else ""))
+    results = {relative: {"status": "failed", "seconds": 0.0, "error": f"unreadable header: {error}"}
+               for relative, error in unreadable.items()}
+    jobs = []
+    for relative in sources:
+        path = os.path.join(source_dir, relative)
+        known = manifest["hashes"].get(relative)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            results[relative] = {"status": "failed", "seconds": 0.0, "error": str(e)}
+            continue
+        converted = manifest["converted"].get(known["hash"]) if known else None
+        if (known and known["signature"] == [stat.st_size, stat.st_mtime_ns] and converted
+                and os.path.exists(os.path.join(output_dir, converted["output"]))):
+            results[relative] = {"status": "skipped", "seconds": 0.0, "output": converted["output"]}
+            continue
+        output = os.path.join(output_dir, os.path.splitext(relative)[0] + "_zimage.safetensors")
+        jobs.append({"relative": relative, "source": path, "output": output, "output_dir": output_dir,
+                     "known": known, "converted": manifest["converted"],
+                     "stream": stream, "fit": fit, "precision": precision})
+    save_json(os.path.join(output_dir, manifest_name), manifest)
+
+    start_time = time.time()
+    if jobs:
+        workers = workers or min(4, os.cpu_count() or 1)
+        print(f"Converting {len(jobs)} files with {workers} workers, {len(results)} unchanged or unreadable files skipped...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(convert_job, job): job for job in jobs}
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                result = future.result()
+                if "hash" in result:
+                    manifest["hashes"][job["relative"]] = {"signature": result.pop("signature"), "hash": result["hash"]}
+                digest = result.pop("hash", None)
+                results[job["relative"]] = result
+                if result["status"] == "converted":
+                    manifest["converted"][digest] = {"source": job["relative"], "output": result["output"]}
+                save_json(os.path.join(output_dir, manifest_name), manifest)
+                print(f"\r{done}/{len(jobs)} processed", end="", flush=True)
+        print()
+
+    counts = {status: sum(1 for r in results.values() if r["status"] == status)
+              for status in ("converted", "skipped", "failed")}
+    summary = {"source_dir": os.path.abspath(source_dir), "seconds": round(time.time() - start_time, 3),
+               "counts": counts, "files": dict(sorted(results.items()))}
+    save_json(os.path.join(output_dir, summary_name), summary)
+    print_summary(summary)
+    return summary
+
+def print_summary(summary):
+    """
+    Prints per-file timings for converted files and every failure.
+    """
+    for relative, result in summary["files"].items():
+        if result["status"] == "converted":
+            notes = []
+            if result.get("problems"):
+                notes.append(f"{result['problems']} structure problems")
+            if result.get("dropped_single_blocks"):
+                notes.append(f"{result['dropped_single_blocks']} single-block modules dropped")
+            warning = f"  ({', '.join(notes)})" if notes else ""
+            print(f"  {result['seconds']:>7.2f}s  {relative}{warning}")
+        elif result["status"] == "failed":
+            print(f"  FAILED    {relative}: {result['error']}")
+    counts = summary["counts"]
+    dropped = sum(1 for result in summary["files"].values() if result.get("dropped_single_blocks"))
+    if dropped:
+        print(f"{dropped} converted files had single-block modules, which are dropped as Z-Image has no counterpart.")
+    print(f"Converted {counts['converted']}, skipped {counts['skipped']} unchanged, "
+          f"{counts['failed']} failed in {summary['seconds']:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert every Flux LoRA in a folder tree to the Z-Image layout.")
+    parser.add_argument("source_dir", help="Folder searched recursively for Flux LoRAs")
+    parser.add_argument("output_dir", help="Folder for the converted LoRAs, manifest and summary")
+    parser.add_argument("--stream", choices=["img", "txt"], default="img", help="Flux double-block stream to convert")
+    parser.add_argument("--keep_widths", action="store_true", help="Keep Flux's feature widths instead of fitting Z-Image's")
+    parser.add_argument("--save_precision", default=None, help="fp16, bf16 or fp32 (default: same as the input)")
+    parser.add_argument("--workers", type=int, default=None, help="Conversion processes (default: up to 4)")
+    args = parser.parse_args()
+    convert_directory(args.source_dir, args.output_dir, args.stream, not args.keep_widths, args.save_precision, args.workers)